@@ -14,6 +14,7 @@ DOCUMENTATION = """
       - E(BWS_REGION): environment variable
       - E(BWS_API_URL): environment variable
       - E(BWS_IDENTITY_URL): environment variable
+      - E(BWS_PROJECTS): environment variable
       - https://github.com/ripplefcl/bws-cache#request-headers-and-server-defaults
     short_description: Retrieve secrets from bws-cache
     description:
@@ -84,9 +85,12 @@ class BwsCacheSecretLookup:
             "X-BWS-REGION": os.environ.get("BWS_REGION"),
             "X-BWS-API-URL": os.environ.get("BWS_API_URL"),
             "X-BWS-IDENTITY-URL": os.environ.get("BWS_IDENTITY_URL"),
+            "X-BWS-PROJECTS": os.environ.get("BWS_PROJECTS"),
         }
 
         self.headers = {k: v for k, v in headers.items() if v}  # remove empty headers
+        # kept open so every term in a lookup shares one connection
+        self.conn: http.client.HTTPConnection | None = None
 
     def is_valid_uuid(self, val):
         """Check if input is a valid UUID"""
@@ -96,37 +100,60 @@ class BwsCacheSecretLookup:
         except ValueError:
             return False
 
+    def _connect(self, bws_cache_url: str):
+        parsed_url = urlparse(bws_cache_url)
+        return (
+            http.client.HTTPSConnection(parsed_url.netloc, timeout=REQUEST_TIMEOUT)
+            if parsed_url.scheme == "https"
+            else http.client.HTTPConnection(parsed_url.netloc, timeout=REQUEST_TIMEOUT)
+        )
+
+    def close(self):
+        """Close the connection kept open between requests."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
     def make_request(self, request_path: str):
         """Perform an HTTP GET request to the specified endpoint."""
-        if not self.bws_cache_url:
+        bws_cache_url = self.bws_cache_url
+        if not bws_cache_url:
             raise AnsibleUndefinedVariable(
                 "BWS_CACHE_URL environment variable must be set."
             )
 
-        parsed_url = urlparse(self.bws_cache_url)
-        conn = (
-            http.client.HTTPSConnection(parsed_url.netloc, timeout=REQUEST_TIMEOUT)
-            if parsed_url.scheme == "https"
-            else http.client.HTTPConnection(parsed_url.netloc, timeout=REQUEST_TIMEOUT)
-        )
-
         # Ensure endpoint starts with a slash
         if not request_path.startswith("/"):
             request_path = f"/{request_path}"
 
+        request_url = f"{urlparse(bws_cache_url).path}{request_path}"
+        reused = self.conn is not None
+        if self.conn is None:
+            self.conn = self._connect(bws_cache_url)
+
         try:
-            request_url = f"{parsed_url.path}{request_path}"
-            conn.request("GET", request_url, headers=self.headers)
-            response = conn.getresponse()
+            try:
+                self.conn.request("GET", request_url, headers=self.headers)
+                response = self.conn.getresponse()
+            except (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine):
+                if not reused:
+                    raise
+                # the server closed the idle connection, retry on a new one
+                self.close()
+                self.conn = self._connect(bws_cache_url)
+                self.conn.request("GET", request_url, headers=self.headers)
+                response = self.conn.getresponse()
             data = response.read()
-            conn.close()
+            if response.will_close:
+                self.close()
 
             if response.status == 200:
                 return json.loads(data)
             raise BwsCacheSecretLookupException(
                 f"Failed to retrieve secret: {response.status} - {data.decode()}"
             )
-        except (http.client.HTTPException, TimeoutError) as err:
+        except (http.client.HTTPException, OSError) as err:
+            self.close()
             raise BwsCacheSecretLookupException(
                 f"Error while querying bws-cache: {err}"
             )
@@ -151,4 +178,7 @@ class BwsCacheSecretLookup:
 class LookupModule(LookupBase):
     def run(self, terms, variables=None, **kwargs):  # type: ignore
         bws_cache = BwsCacheSecretLookup()
-        return [bws_cache.get_secret(term) for term in terms]
+        try:
+            return [bws_cache.get_secret(term) for term in terms]
+        finally:
+            bws_cache.close()
@@ -0,0 +1,105 @@
+import threading
+import time
+from dataclasses import dataclass
+
+from errors import ThrottledException
+
+# tenants are forgotten once idle, so this only bounds bursts of new tokens
+MAX_TRACKED_TENANTS = 10000
+
+
+@dataclass(slots=True, frozen=True)
+class Limits:
+    """Requests in flight and requests per second allowed per tenant, 0 is unlimited."""
+
+    concurrency: int = 0
+    rate: float = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.concurrency > 0 or self.rate > 0
+
+    @property
+    def burst(self) -> float:
+        # a second's worth of requests, and at least one so slow rates still admit
+        return max(self.rate, 1)
+
+
+class _TenantState:
+    __slots__ = ("in_flight", "tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.in_flight = 0
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, limits: Limits, now: float):
+        if limits.rate:
+            self.tokens = min(
+                limits.burst, self.tokens + (now - self.updated) * limits.rate
+            )
+        self.updated = now
+
+
+class AdmissionController:
+    """Per-token and per-region concurrency limits and token bucket rate quotas."""
+
+    def __init__(self, token_limits: Limits, region_limits: Limits):
+        self.limits = {"token": token_limits, "region": region_limits}
+        self.enabled = token_limits.enabled or region_limits.enabled
+        self._states: dict[tuple[str, str], _TenantState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, scope: str, tenant: str, now: float) -> _TenantState:
+        state = self._states.get((scope, tenant))
+        if state is None:
+            if len(self._states) >= MAX_TRACKED_TENANTS:
+                self._evict_idle(now)
+            state = self._states[(scope, tenant)] = _TenantState(
+                self.limits[scope].burst, now
+            )
+        return state
+
+    def _evict_idle(self, now: float):
+        for key, state in list(self._states.items()):
+            limits = self.limits[key[0]]
+            state.refill(limits, now)
+            if state.in_flight == 0 and state.tokens >= limits.burst:
+                del self._states[key]
+
+    def acquire(self, token_tenant: str, region_tenant: str) -> list[_TenantState]:
+        """Take a slot for a request, raising ThrottledException if over a limit."""
+        if not self.enabled:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            states = [
+                (scope, tenant, self._state(scope, tenant, now))
+                for scope, tenant in (
+                    ("token", token_tenant),
+                    ("region", region_tenant),
+                )
+                if self.limits[scope].enabled
+            ]
+            # every check passes before anything is taken, so a rejection leaves no trace
+            for scope, tenant, state in states:
+                limits = self.limits[scope]
+                if limits.concurrency and state.in_flight >= limits.concurrency:
+                    raise ThrottledException(scope, tenant, "concurrency", 1)
+                state.refill(limits, now)
+                if limits.rate and state.tokens < 1:
+                    raise ThrottledException(
+                        scope, tenant, "rate", (1 - state.tokens) / limits.rate
+                    )
+            for scope, _, state in states:
+                state.in_flight += 1
+                if self.limits[scope].rate:
+                    state.tokens -= 1
+            return [state for _, _, state in states]
+
+    def release(self, slot: list[_TenantState]):
+        if not slot:
+            return
+        with self._lock:
+            for state in slot:
+                state.in_flight -= 1
@@ -0,0 +1,367 @@
+import fnmatch
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from errors import CacheBackendException
+from key_index import SortedKeyIndex, glob_literal_prefix
+from models import CacheStats
+from profiling import profiler
+from secret import SecretMetaData, SecretResponse
+from value_store import InlineSecret, ValueStore, encode_secret
+
+logger = logging.getLogger("bwscache.cache_backend")
+
+ENCRYPT_CACHE_VALUES = os.environ.get("ENCRYPT_CACHE_VALUES", "false").lower() == "true"
+
+REDIS_NONCE_SIZE = 12
+REDIS_SCAN_BATCH_SIZE = 256
+
+
+class CacheBackend(ABC):
+    """Storage for a single client's cached secrets."""
+
+    @abstractmethod
+    def get_by_id(self, secret_id: str) -> SecretResponse | None: ...
+
+    @abstractmethod
+    def get_by_key(self, secret_key: str) -> SecretResponse | None: ...
+
+    @abstractmethod
+    def query(
+        self, prefix: str | None, glob: str | None, limit: int, cursor: str | None
+    ) -> tuple[list[SecretResponse], str | None]: ...
+
+    @abstractmethod
+    def upsert(self, secrets: list[SecretResponse]): ...
+
+    @abstractmethod
+    def delete(self, secret_ids: list[str]): ...
+
+    @abstractmethod
+    def replace(self, secrets: list[SecretResponse]): ...
+
+    @abstractmethod
+    def snapshot(self) -> list[SecretResponse]: ...
+
+    @abstractmethod
+    def clear(self): ...
+
+    @abstractmethod
+    def stats(self) -> CacheStats: ...
+
+    def is_empty(self) -> bool:
+        return self.stats().secret_cache_size == 0
+
+
+CacheBackendFactory = Callable[[str, str], CacheBackend]
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, encrypt: bool = ENCRYPT_CACHE_VALUES):
+        self.encrypt = encrypt
+        self.secret_cache: dict[str, SecretResponse] = {}
+        self.key_map: dict[str, str] = {}
+        self.key_index = SortedKeyIndex()
+        self.value_store = ValueStore(encrypt)
+        self.cache_lock = profiler.make_lock("cache_lock")
+
+    def get_by_id(self, secret_id: str) -> SecretResponse | None:
+        with self.cache_lock:
+            return self.secret_cache.get(secret_id, None)
+
+    def get_by_key(self, secret_key: str) -> SecretResponse | None:
+        with self.cache_lock:
+            secret_id = self.key_map.get(secret_key, None)
+            if secret_id is None:
+                return None
+            return self.secret_cache.get(secret_id, None)
+
+    def query(
+        self, prefix: str | None, glob: str | None, limit: int, cursor: str | None
+    ) -> tuple[list[SecretResponse], str | None]:
+        with self.cache_lock:
+            if glob is not None:
+                keys, next_cursor = self.key_index.glob(glob, limit, cursor)
+            else:
+                keys, next_cursor = self.key_index.prefix(prefix or "", limit, cursor)
+            return [self.secret_cache[self.key_map[key]] for key in keys], next_cursor
+
+    def upsert(self, secrets: list[SecretResponse]):
+        with self.cache_lock:
+            for secret in secrets:
+                previous = self.secret_cache.get(secret.id)
+                if previous is not None and previous.key != secret.key:
+                    self.key_map.pop(previous.key, None)
+                    self.key_index.remove(previous.key)
+                self.key_map[secret.key] = secret.id
+                self.secret_cache[secret.id] = secret.stored(self.value_store)
+            self.key_index.update(secret.key for secret in secrets)
+            logger.debug(f"Loaded {len(self.secret_cache)} secrets into cache")
+
+    def delete(self, secret_ids: list[str]):
+        with self.cache_lock:
+            for secret_id in secret_ids:
+                secret = self.secret_cache.pop(secret_id, None)
+                if secret is not None:
+                    self.key_map.pop(secret.key, None)
+                    self.key_index.remove(secret.key)
+
+    def replace(self, secrets: list[SecretResponse]):
+        # built outside the lock so readers never see a partially loaded cache
+        value_store = ValueStore(self.encrypt)
+        secret_cache = {secret.id: secret.stored(value_store) for secret in secrets}
+        key_map = {secret.key: secret.id for secret in secrets}
+        key_index = SortedKeyIndex()
+        key_index.update(key_map)
+        with self.cache_lock:
+            self.secret_cache = secret_cache
+            self.key_map = key_map
+            self.key_index = key_index
+            self.value_store = value_store
+        logger.debug(f"Loaded {len(secret_cache)} secrets into cache")
+
+    def snapshot(self) -> list[SecretResponse]:
+        with self.cache_lock:
+            return list(self.secret_cache.values())
+
+    def clear(self):
+        self.replace([])
+
+    def stats(self) -> CacheStats:
+        with self.cache_lock:
+            return CacheStats(
+                secret_cache_size=len(self.secret_cache),
+                keymap_cache_size=len(self.key_map),
+            )
+
+    def is_empty(self) -> bool:
+        return not self.secret_cache
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared between replicas through a Redis compatible server.
+
+    Records are AES-GCM encrypted with a key derived from the BWS token, so only
+    replicas that have been sent the token can read them.
+    """
+
+    def __init__(self, redis_client, client_hash: str, bws_token: str):
+        from redis import RedisError
+
+        self.redis = redis_client
+        self.redis_error = RedisError
+        namespace = f"bwscache:{client_hash}"
+        self.secrets_key = f"{namespace}:secrets"
+        self.keys_key = f"{namespace}:keys"
+        self.ids_key = f"{namespace}:ids"
+        self.index_key = f"{namespace}:index"
+        self._associated_data = namespace.encode("utf-8")
+        self._aead = AESGCM(
+            hashlib.sha256(f"bws-cache:{bws_token}".encode("utf-8")).digest()
+        )
+
+    @staticmethod
+    def _handle_redis_errors(func):
+        @functools.wraps(func)
+        def wrapper(self: "RedisCacheBackend", *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except self.redis_error as e:
+                logger.error("Redis cache backend request failed: %s", e)
+                raise CacheBackendException("Cache backend unavailable") from e
+
+        return wrapper
+
+    def _encode(self, secret: SecretResponse) -> bytes:
+        nonce = os.urandom(REDIS_NONCE_SIZE)
+        data = encode_secret(secret.id, secret.key, secret.raw_value)
+        return nonce + self._aead.encrypt(nonce, data, self._associated_data)
+
+    def _decode(self, data: bytes) -> SecretResponse:
+        plaintext = self._aead.decrypt(
+            data[:REDIS_NONCE_SIZE], data[REDIS_NONCE_SIZE:], self._associated_data
+        )
+        record = json.loads(plaintext)
+        return SecretResponse(
+            SecretMetaData(record["key"], record["id"]), InlineSecret(plaintext)
+        )
+
+    def _fetch_keys(self, keys: list[str]) -> list[SecretResponse]:
+        if not keys:
+            return []
+        secret_ids = [
+            secret_id
+            for secret_id in self.redis.hmget(self.keys_key, keys)
+            if secret_id is not None
+        ]
+        if not secret_ids:
+            return []
+        return [
+            self._decode(data)
+            for data in self.redis.hmget(self.secrets_key, secret_ids)
+            if data is not None
+        ]
+
+    def _write(self, pipe, secrets: list[SecretResponse]):
+        if not secrets:
+            return
+        pipe.hset(
+            self.secrets_key,
+            mapping={secret.id: self._encode(secret) for secret in secrets},
+        )
+        pipe.hset(self.keys_key, mapping={secret.key: secret.id for secret in secrets})
+        pipe.hset(self.ids_key, mapping={secret.id: secret.key for secret in secrets})
+        pipe.zadd(self.index_key, {secret.key: 0 for secret in secrets})
+
+    def _remove_keys(self, pipe, keys: list[str]):
+        if keys:
+            pipe.hdel(self.keys_key, *keys)
+            pipe.zrem(self.index_key, *keys)
+
+    @_handle_redis_errors
+    def get_by_id(self, secret_id: str) -> SecretResponse | None:
+        data = self.redis.hget(self.secrets_key, secret_id)
+        if data is None:
+            return None
+        return self._decode(data)
+
+    @_handle_redis_errors
+    def get_by_key(self, secret_key: str) -> SecretResponse | None:
+        secret_id = self.redis.hget(self.keys_key, secret_key)
+        if secret_id is None:
+            return None
+        return self.get_by_id(secret_id.decode("utf-8"))
+
+    @_handle_redis_errors
+    def query(
+        self, prefix: str | None, glob: str | None, limit: int, cursor: str | None
+    ) -> tuple[list[SecretResponse], str | None]:
+        literal_prefix = glob_literal_prefix(glob) if glob is not None else prefix or ""
+        if cursor is not None and cursor >= literal_prefix:
+            lower = b"(" + cursor.encode("utf-8")
+        elif literal_prefix:
+            lower = b"[" + literal_prefix.encode("utf-8")
+        else:
+            lower = b"-"
+        # 0xff never occurs in utf-8 so this bounds every key with the prefix
+        upper = (
+            b"[" + literal_prefix.encode("utf-8") + b"\xff" if literal_prefix else b"+"
+        )
+
+        if glob is None:
+            batch = self.redis.zrangebylex(self.index_key, lower, upper, 0, limit + 1)
+            keys = [key.decode("utf-8") for key in batch[:limit]]
+            next_cursor = keys[-1] if len(batch) > limit else None
+            return self._fetch_keys(keys), next_cursor
+
+        matcher = re.compile(fnmatch.translate(glob))
+        page: list[str] = []
+        while True:
+            batch = self.redis.zrangebylex(
+                self.index_key, lower, upper, 0, REDIS_SCAN_BATCH_SIZE
+            )
+            for raw_key in batch:
+                key = raw_key.decode("utf-8")
+                if matcher.match(key):
+                    if len(page) == limit:
+                        return self._fetch_keys(page), page[-1]
+                    page.append(key)
+            if len(batch) < REDIS_SCAN_BATCH_SIZE:
+                return self._fetch_keys(page), None
+            lower = b"(" + batch[-1]
+
+    @_handle_redis_errors
+    def upsert(self, secrets: list[SecretResponse]):
+        if not secrets:
+            return
+        previous_keys = self.redis.hmget(self.ids_key, [s.id for s in secrets])
+        renamed = [
+            previous.decode("utf-8")
+            for previous, secret in zip(previous_keys, secrets)
+            if previous is not None and previous.decode("utf-8") != secret.key
+        ]
+        with self.redis.pipeline(transaction=True) as pipe:
+            self._remove_keys(pipe, renamed)
+            self._write(pipe, secrets)
+            pipe.execute()
+
+    @_handle_redis_errors
+    def delete(self, secret_ids: list[str]):
+        if not secret_ids:
+            return
+        previous_keys = self.redis.hmget(self.ids_key, secret_ids)
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self.secrets_key, *secret_ids)
+            pipe.hdel(self.ids_key, *secret_ids)
+            self._remove_keys(
+                pipe, [key.decode("utf-8") for key in previous_keys if key is not None]
+            )
+            pipe.execute()
+
+    @_handle_redis_errors
+    def replace(self, secrets: list[SecretResponse]):
+        with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.secrets_key, self.keys_key, self.ids_key, self.index_key)
+            self._write(pipe, secrets)
+            pipe.execute()
+
+    @_handle_redis_errors
+    def snapshot(self) -> list[SecretResponse]:
+        return [self._decode(data) for data in self.redis.hvals(self.secrets_key)]
+
+    @_handle_redis_errors
+    def clear(self):
+        self.redis.delete(self.secrets_key, self.keys_key, self.ids_key, self.index_key)
+
+    @_handle_redis_errors
+    def stats(self) -> CacheStats:
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hlen(self.secrets_key)
+            pipe.hlen(self.keys_key)
+            secret_cache_size, keymap_cache_size = pipe.execute()
+        return CacheStats(
+            secret_cache_size=secret_cache_size,
+            keymap_cache_size=keymap_cache_size,
+        )
+
+    @_handle_redis_errors
+    def is_empty(self) -> bool:
+        return not self.redis.exists(self.secrets_key)
+
+
+@functools.cache
+def get_redis_client(redis_url: str):
+    try:
+        import redis
+    except ImportError:
+        raise ValueError("A redis URL is set but the redis package is missing")
+    return redis.Redis.from_url(redis_url)
+
+
+def make_cache_backend_factory(
+    backend: str, redis_url: str | None = None
+) -> CacheBackendFactory:
+    if backend == "memory":
+
+        def make_memory_backend(client_hash: str, bws_token: str) -> CacheBackend:
+            return MemoryCacheBackend()
+
+        return make_memory_backend
+    elif backend == "redis":
+        if not redis_url:
+            raise ValueError("REDIS_URL must be set when CACHE_BACKEND is redis")
+        redis_client = get_redis_client(redis_url)
+        logger.info("Using redis cache backend")
+
+        def make_redis_backend(client_hash: str, bws_token: str) -> CacheBackend:
+            return RedisCacheBackend(redis_client, client_hash, bws_token)
+
+        return make_redis_backend
+    raise ValueError("CACHE_BACKEND must be one of memory or redis")
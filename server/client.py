@@ -1,19 +1,32 @@
+import asyncio
 import datetime
 import enum
 import functools
 import hashlib
-import json
 import logging
 import os
+import random
+import sys
 import time
-from dataclasses import dataclass
-from threading import Lock, Thread
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event, RLock, Thread
 
 import requests
-import yaml
-from bws_sdk import ApiError, BWSecretClient, Region
+from bws_sdk import (
+    ApiError,
+    BitwardenSecret,
+    BWSecretClient,
+    BWSSDKError,
+    Region,
+    SecretNotFoundError,
+)
+from cache_backend import CacheBackend, CacheBackendFactory, MemoryCacheBackend
 from errors import (
     BWSAPIRateLimitExceededException,
+    CacheBackendException,
+    ClientAuthTimeoutException,
+    InvalidKeyQueryException,
     InvalidSecretIDException,
     InvalidTokenException,
     MissingSecretException,
@@ -21,9 +34,14 @@ from errors import (
     SendRequestException,
     UnauthorizedTokenException,
     UnknownKeyException,
+    UnknownProjectException,
 )
+from miss_batcher import MissBatcher
 from models import CacheStats, StatsResponse
+from profiling import profiler
 from prom_client import PromMetricsClient
+from refresh_lease import LocalRefreshLease, RefreshLease
+from secret import SecretMetaData, SecretResponse
 
 logger = logging.getLogger("bwscache.client")
 
@@ -46,8 +64,6 @@ REGION_MAPPING = {
 }
 
 
-PARSE_SECRET_VALUES = os.environ.get("PARSE_SECRET_VALUES", "false").lower() == "true"
-
 API_URL = os.environ.get("BWS_API_URL", "")
 IDENTITY_URL = os.environ.get("BWS_IDENTITY_URL", "")
 
@@ -60,70 +76,52 @@ elif API_URL and IDENTITY_URL:
     )
 
 
-def generate_hash(value: str, region: Region) -> str:
-    value = f"{value}{region.api_url}{region.identity_url}"
-    return hashlib.sha256(value.encode("utf-8")).hexdigest()
-
-
-@dataclass
-class SecretMetaData:
-    key: str
-    id: str
-
+TOKEN_RENEWAL_LEAD = 120
+TOKEN_RENEWAL_RETRY = 30
+MAX_REFRESH_BACKOFF = 8
+MISS_BATCH_WINDOW = 0.005
+MISS_SYNC_INTERVAL = 1
+MISSING_SECRET_TTL = 30
+# refresh leases are renewed every REFRESH_RATE, so a stopped replica's leases expire
+# a few intervals later, plus slack for a slow sync holding up the renewals
+LEASE_TTL_INTERVALS = 3
+LEASE_TTL_GRACE = 30
 
-class SecretResponse:
-    def __init__(self, metadata: SecretMetaData, value: str | None):
-        self._metadata = metadata
-        self._value = value
 
-    @property
-    def metadata(self):
-        return self._metadata
-
-    @property
-    def key(self):
-        return self._metadata.key
-
-    @property
-    def id(self):
-        return self._metadata.id
+def generate_hash(
+    value: str, region: Region, projects: frozenset[str] | None = None
+) -> str:
+    value = f"{value}{region.api_url}{region.identity_url}"
+    if projects:
+        value += ",".join(sorted(projects))
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
 
-    @property
-    def value(self):
-        data = self._value
-        if data is not None:
-            if not PARSE_SECRET_VALUES:
-                return data
-            else:
-                try:
-                    data = json.loads(data)
-                    logger.debug("JSON parse succeeded")
-                    return data
-                except json.JSONDecodeError:
-                    logger.debug("JSON parse failed... trying yaml")
-                try:
-                    data = yaml.safe_load(data)
-                    logger.debug("YAML parse succeeded")
-                    return data
-                except yaml.YAMLError:
-                    logger.debug("YAML parse failed... return raw secret")
-        else:
-            logger.info("Secret not found")
-        return None
 
-    def to_json(self):
-        return {"key": self.key, "id": self.id, "value": self.value}
+def is_valid_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
 
 
 class BWSClient:
-    def __init__(self, bws_token: str, region: Region):
+    def __init__(
+        self, bws_token: str, region: Region, projects: frozenset[str] | None = None
+    ):
         self.region = region
         self.bws_token = bws_token
-        self.client_lock = Lock()
+        self.projects = projects
+        # revision date of each secret in the selected projects, by secret ID
+        self.revisions: dict[str, str] = {}
+        # secrets fetched by ID from outside the selected projects, refreshed with them
+        self.lazy_ids: set[str] = set()
+        self.client_lock = profiler.make_lock("client_lock")
         self.last_sync = datetime.datetime.now(
             tz=datetime.timezone.utc
         ) - datetime.timedelta(seconds=60)
         self.bws_client = self.make_client(bws_token, region)
+        self.renew_at = self._schedule_renewal()
 
     @staticmethod
     def _handle_api_errors(func):
@@ -155,25 +153,118 @@ class BWSClient:
 
         return wrapper
 
+    @staticmethod
+    def _make_secret_response(secret: BitwardenSecret) -> SecretResponse:
+        # interned so key_map, key_index and metadata share one copy of each string
+        metadata = SecretMetaData(sys.intern(secret.key), sys.intern(str(secret.id)))
+        return SecretResponse(metadata, secret.value)
+
     @_handle_api_errors
     def make_client(self, bws_token: str, region: Region) -> BWSecretClient:
-        return BWSecretClient(region, bws_token, f"/dev/shm/token_{self.client_hash}")
+        with profiler.span("bws.auth", client=self.client_hash):
+            return BWSecretClient(
+                region, bws_token, f"/dev/shm/token_{self.client_hash}"
+            )
+
+    @property
+    def token_expiry(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(
+            self.bws_client.auth.oauth_jwt["payload"]["exp"], tz=datetime.timezone.utc
+        )
+
+    def _schedule_renewal(self) -> datetime.datetime:
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        remaining = (self.token_expiry - now).total_seconds()
+        # jittered so clients created together don't all renew together
+        lead = TOKEN_RENEWAL_LEAD * random.uniform(1, 2)
+        return now + datetime.timedelta(seconds=max(remaining - lead, remaining / 2, 0))
+
+    @_handle_api_errors
+    def renew_token(self):
+        with self.client_lock:
+            logger.debug("Renewing access token")
+            # bws_sdk only renews once the token has expired, so renew it directly
+            with profiler.span("bws.auth", client=self.client_hash):
+                self.bws_client.auth._identity_request()
+        self.renew_at = self._schedule_renewal()
+
+    def retry_renewal(self):
+        self.renew_at = datetime.datetime.now(
+            tz=datetime.timezone.utc
+        ) + datetime.timedelta(seconds=TOKEN_RENEWAL_RETRY)
+
+    def _api_request(self, method: str, path: str, **kwargs):
+        # the SDK has no project aware calls, so these use its authenticated session
+        self.bws_client._reload_auth()
+        response = self.bws_client.session.request(
+            method, f"{self.region.api_url}{path}", **kwargs
+        )
+        # classified on the status alone, paths and bodies can contain any digits
+        status = response.status_code
+        if status == 200:
+            return response.json()
+        if status == 404:
+            raise SecretNotFoundError("Not found")
+        elif status in (401, 403):
+            raise UnauthorizedTokenException("Unauthorized token")
+        elif status == 429:
+            raise BWSAPIRateLimitExceededException("Too many requests")
+        elif status >= 500:
+            raise SendRequestException()
+        raise BWSSDKError(f"Unexpected response status {status}")
+
+    def _list_project_revisions(self) -> dict[str, str]:
+        revisions: dict[str, str] = {}
+        for project_id in sorted(self.projects or ()):
+            try:
+                data = self._api_request("GET", f"/projects/{project_id}/secrets")
+            except SecretNotFoundError as e:
+                raise UnknownProjectException(project_id) from e
+            for secret in data.get("secrets") or []:
+                revisions[secret["id"]] = secret["revisionDate"]
+        return revisions
+
+    def _get_secrets_by_ids(self, secret_ids: list[str]) -> list[BitwardenSecret]:
+        if not secret_ids:
+            return []
+        data = self._api_request(
+            "POST", "/secrets/get-by-ids", json={"ids": secret_ids}
+        )
+        return [self.bws_client._parse_secret(secret) for secret in data["data"]]
+
+    def _sync_projects(self, full: bool) -> list[BitwardenSecret]:
+        """Like sync, returns every secret in the selected projects if any changed."""
+        revisions = self._list_project_revisions()
+        lazy_secrets = self._get_existing_secrets(
+            [secret_id for secret_id in self.lazy_ids if secret_id not in revisions]
+        )
+        self.lazy_ids = {secret.id for secret in lazy_secrets}
+        for secret in lazy_secrets:
+            revisions[secret.id] = secret.revisionDate.isoformat()
+        if not full and revisions == self.revisions:
+            return []
+        secrets = self._get_existing_secrets(
+            [secret_id for secret_id in revisions if secret_id not in self.lazy_ids]
+        )
+        self.revisions = revisions
+        return secrets + lazy_secrets
 
     @_handle_api_errors
     def list_secrets(self):
         with self.client_lock:
             logger.debug("Listing secrets")
-            secrets = self.bws_client.sync(
-                datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
-            )
+            with profiler.span("bws.sync", client=self.client_hash, kind="full"):
+                if self.projects:
+                    secrets = self._sync_projects(full=True)
+                else:
+                    secrets = self.bws_client.sync(
+                        datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+                    )
         if not secrets:
             logger.debug("No secrets found")
         else:
             logger.debug("Found %s secrets", len(secrets))
-        return [
-            SecretResponse(SecretMetaData(secret.key, str(secret.id)), secret.value)
-            for secret in secrets
-        ]
+        return [self._make_secret_response(secret) for secret in secrets]
 
     @_handle_api_errors
     def get_updated_secrets(self):
@@ -181,24 +272,61 @@ class BWSClient:
         latest_sync = datetime.datetime.now(tz=datetime.timezone.utc)
         with self.client_lock:
             logger.debug("Getting updated secrets")
-            secrets = self.bws_client.sync(self.last_sync)
+            with profiler.span("bws.sync", client=self.client_hash, kind="delta"):
+                if self.projects:
+                    secrets = self._sync_projects(full=False)
+                else:
+                    secrets = self.bws_client.sync(self.last_sync)
         logger.debug("Got updated secrets")
         self.last_sync = latest_sync
         if secrets:
             for secret in secrets:
                 logger.debug("Got updated secret %s", secret.id)
-                update_secrets.append(
-                    SecretResponse(
-                        SecretMetaData(secret.key, str(secret.id)), secret.value
-                    )
-                )
+                update_secrets.append(self._make_secret_response(secret))
         else:
             logger.debug("No secrets updated")
         return update_secrets
 
+    def _get_secret_by_id(self, secret_id: str) -> BitwardenSecret | None:
+        try:
+            return self.bws_client.get_by_id(secret_id)
+        except ApiError as e:
+            if e.args[0].startswith("Failed to retrieve secret: 404 "):
+                return None
+            raise
+
+    def _get_existing_secrets(self, secret_ids: list[str]) -> list[BitwardenSecret]:
+        if len(secret_ids) == 1:
+            secret = self._get_secret_by_id(secret_ids[0])
+            return [secret] if secret is not None else []
+        try:
+            return self._get_secrets_by_ids(secret_ids)
+        except SecretNotFoundError:
+            # the whole batch fails if any ID doesn't exist, so halve it to find which
+            middle = len(secret_ids) // 2
+            return self._get_existing_secrets(
+                secret_ids[:middle]
+            ) + self._get_existing_secrets(secret_ids[middle:])
+
+    @_handle_api_errors
+    def get_secrets(self, secret_ids: list[str]) -> list[SecretResponse]:
+        """Fetch secrets by ID, leaving out any that don't exist."""
+        with self.client_lock:
+            logger.debug("Fetching %s secrets", len(secret_ids))
+            with profiler.span(
+                "bws.get", client=self.client_hash, count=str(len(secret_ids))
+            ):
+                secrets = self._get_existing_secrets(secret_ids)
+            if self.projects:
+                for secret in secrets:
+                    if secret.id not in self.revisions:
+                        self.lazy_ids.add(secret.id)
+                        self.revisions[secret.id] = secret.revisionDate.isoformat()
+        return [self._make_secret_response(secret) for secret in secrets]
+
     @property
     def client_hash(self):
-        return generate_hash(self.bws_token, self.region)
+        return generate_hash(self.bws_token, self.region, self.projects)
 
 
 class CachedBWSClient:
@@ -207,77 +335,185 @@ class CachedBWSClient:
         bws_secret_token: str,
         region: Region,
         prom_client: PromMetricsClient,
+        cache_backend_factory: CacheBackendFactory | None = None,
+        projects: frozenset[str] | None = None,
+        refresh_lease: RefreshLease | None = None,
+        lease_ttl: float = LEASE_TTL_GRACE,
     ):
         self.prom_client = prom_client
-        self.client = BWSClient(bws_secret_token, region)
-        self.secret_cache: dict[str, SecretResponse] = {}
-        self.key_map: dict[str, str] = {}
-        self.cache_lock = Lock()
+        self.client = BWSClient(bws_secret_token, region, projects)
+        self.refresh_lease = refresh_lease or LocalRefreshLease()
+        self.lease_ttl = lease_ttl
+        if cache_backend_factory is None:
+            self.cache: CacheBackend = MemoryCacheBackend()
+        else:
+            self.cache = cache_backend_factory(self.client_hash, bws_secret_token)
+        self.refresh_lock = profiler.make_lock("refresh_lock")
+        self.secret_misses = MissBatcher(
+            self._fetch_missing_secrets, MISS_BATCH_WINDOW, MISS_SYNC_INTERVAL
+        )
+        self.key_misses = MissBatcher(self._sync_missing_keys, MISS_BATCH_WINDOW)
+        self.last_miss_sync = 0.0
+        # IDs BWS reported missing, with when to ask again
+        self.missing_ids: dict[str, float] = {}
+        self.refresh_backoff = 1
+        self.next_refresh = 0.0
 
     def get_secret_by_id(self, secret_id: str):
-        if not self.secret_cache:
+        if self.cache.is_empty():
             self.preload_secrets()
 
-        with self.cache_lock:
-            cached_secret = self.secret_cache.get(secret_id, None)
+        with profiler.stage("cache_lookup"):
+            cached_secret = self.cache.get_by_id(secret_id)
         if cached_secret is None:
             logger.debug("Cache miss for secret %s", secret_id)
             self.prom_client.tick_cache_miss("secret")
-            raise MissingSecretException("Secret not found")
+            return self.fetch_secret(secret_id)
         else:
             logger.debug("Cache hit for secret %s", secret_id)
             self.prom_client.tick_cache_hits("secret")
         return cached_secret
 
+    def fetch_secret(self, secret_id: str) -> SecretResponse:
+        """Fetch a secret missing from the cache, e.g. outside the selected projects."""
+        # keyed the way the API returns IDs, so dashless or braced forms match
+        try:
+            secret_id = str(uuid.UUID(secret_id))
+        except ValueError:
+            raise MissingSecretException("Secret not found")
+        if self.missing_ids.get(secret_id, 0) > time.monotonic():
+            raise MissingSecretException("Secret not found")
+        secret = self.secret_misses.get(secret_id)
+        if secret is None:
+            raise MissingSecretException("Secret not found")
+        return secret
+
+    def _fetch_missing_secrets(
+        self, secret_ids: list[str]
+    ) -> dict[str, SecretResponse]:
+        self.prom_client.tick_miss_batch("secret", len(secret_ids))
+        secrets = self.client.get_secrets(secret_ids)
+        if secrets:
+            self.cache.upsert(secrets)
+        found = {secret.id: secret for secret in secrets}
+        now = time.monotonic()
+        missing_ids = {
+            secret_id: expiry
+            for secret_id, expiry in self.missing_ids.items()
+            if expiry > now
+        }
+        for secret_id in secret_ids:
+            if secret_id not in found:
+                missing_ids[secret_id] = now + MISSING_SECRET_TTL
+        self.missing_ids = missing_ids
+        return found
+
+    def _sync_missing_keys(self, secret_keys: list[str]) -> dict[str, SecretResponse]:
+        # a missing key may be a newly created secret, which only a sync can find
+        self.prom_client.tick_miss_batch("key", len(secret_keys))
+        now = time.monotonic()
+        if now - self.last_miss_sync < MISS_SYNC_INTERVAL:
+            self._expedite_refresh()
+            return {}
+        self.last_miss_sync = now
+        # only the leaseholder syncs, the rest re-read the backend it writes to
+        if self._holds_miss_lease() and not self.refresh_cache():
+            return {}
+        return {
+            secret_key: secret
+            for secret_key in secret_keys
+            if (secret := self.cache.get_by_key(secret_key)) is not None
+        }
+
     def get_secret_by_key(self, secret_key: str):
-        if not self.key_map:
+        if self.cache.is_empty():
             self.preload_secrets()
 
-        with self.cache_lock:
-            key = self.key_map.get(secret_key, None)
-
-        if key is None:
+        with profiler.stage("cache_lookup"):
+            cached_secret = self.cache.get_by_key(secret_key)
+        if cached_secret is None:
             logger.debug("No key mapping found %s", secret_key)
             self.prom_client.tick_cache_miss("key")
-            raise UnknownKeyException("Key not found")
+            cached_secret = self.key_misses.get(secret_key)
+            if cached_secret is None:
+                raise UnknownKeyException("Key not found")
         logger.debug("Key mapping found %s", secret_key)
-        return self.get_secret_by_id(key)
+        self.prom_client.tick_cache_hits("secret")
+        return cached_secret
 
-    def _load_secrets(self, secrets: list[SecretResponse]):
-        with self.cache_lock:
-            for secret in secrets:
-                self.key_map[secret.key] = secret.id
-                self.secret_cache[secret.id] = secret
-            logger.debug(f"Loaded {len(self.secret_cache)} secrets into cache")
+    def query_secrets(
+        self,
+        prefix: str | None = None,
+        glob: str | None = None,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> tuple[list[SecretResponse], str | None]:
+        if prefix is not None and glob is not None:
+            raise InvalidKeyQueryException("prefix and glob can't be used together")
+        if self.cache.is_empty():
+            self.preload_secrets()
 
-    def refresh_cache(self):
-        secrets = self.client.get_updated_secrets()
-        if secrets:
-            self.reset_cache()
-            self._load_secrets(secrets)
+        with profiler.stage("cache_lookup"):
+            secrets, next_cursor = self.cache.query(prefix, glob, limit, cursor)
+        logger.debug("Key query matched %s secrets", len(secrets))
+        self.prom_client.tick_cache_hits("query")
+        return secrets, next_cursor
+
+    def holds_refresh_lease(self) -> bool:
+        return self.refresh_lease.acquire(self.client_hash, self.lease_ttl)
+
+    def _holds_miss_lease(self) -> bool:
+        try:
+            return self.holds_refresh_lease()
+        except CacheBackendException:
+            logger.warning(
+                "Can't acquire refresh lease for client %s", self.client_hash
+            )
+            return False
+
+    def refresh_cache(self) -> bool:
+        # held across the sync and the write so an older sync can't overwrite a newer one
+        with self.refresh_lock:
+            secrets = self.client.get_updated_secrets()
+            if secrets:
+                self.cache.replace(secrets)
+                # a missing ID may have just been created
+                self.missing_ids = {}
+        return bool(secrets)
+
+    def refresh_due(self) -> bool:
+        return self.next_refresh <= time.monotonic()
+
+    def schedule_refresh(self, changed: bool, period: float) -> int:
+        """Back off refreshes while the secrets are stable, returning syncs skipped."""
+        if changed:
+            self.refresh_backoff = 1
+        else:
+            self.refresh_backoff = min(self.refresh_backoff * 2, MAX_REFRESH_BACKOFF)
+        self.next_refresh = time.monotonic() + period * (self.refresh_backoff - 1)
+        return self.refresh_backoff - 1
+
+    def _expedite_refresh(self):
+        # a miss may be a newly created secret, so stop backing off
+        self.refresh_backoff = 1
+        self.next_refresh = 0.0
 
     def preload_secrets(self):
         logger.debug("Preloading secrets into cache")
         secrets = self.client.list_secrets()
         if secrets:
-            self._load_secrets(secrets)
+            self.cache.upsert(secrets)
         else:
             logger.debug("No secrets found to preload")
 
     def reset_cache(self) -> CacheStats:
         logger.debug("Resetting cache")
         stats = self.stats()
-        with self.cache_lock:
-            self.secret_cache = {}
-            self.key_map = {}
+        self.cache.clear()
         return stats
 
     def stats(self) -> CacheStats:
-        with self.cache_lock:
-            return CacheStats(
-                secret_cache_size=len(self.secret_cache),
-                keymap_cache_size=len(self.key_map),
-            )
+        return self.cache.stats()
 
     @property
     def client_hash(self):
@@ -287,7 +523,7 @@ class CachedBWSClient:
 class ClientList:
     def __init__(self):
         self._clients: dict[str, CachedBWSClient] = {}
-        self._clients_lock = Lock()
+        self._clients_lock = profiler.make_lock("clients_lock")
 
     def add_client(self, client: CachedBWSClient):
         with self._clients_lock:
@@ -307,8 +543,8 @@ class ClientList:
             len(self._clients),
         )
 
-    def get(self, token: str, region: Region):
-        hashed_token = generate_hash(token, region)
+    def get(self, token: str, region: Region, projects: frozenset[str] | None = None):
+        hashed_token = generate_hash(token, region, projects)
         with self._clients_lock:
             return self._clients.get(hashed_token, None)
 
@@ -318,42 +554,142 @@ class ClientList:
 
 
 class CachedClientRefresher:
-    def __init__(self, refresh_interval: int, client_list: ClientList):
+    def __init__(
+        self,
+        refresh_interval: int,
+        client_list: ClientList,
+        prom_client: PromMetricsClient,
+        refresh_lease: RefreshLease,
+    ):
         self.clients = client_list
         self.refresh_interval = refresh_interval
+        self.prom_client = prom_client
+        self.refresh_lease = refresh_lease
+        self.stopped = Event()
         self.refresh_loop = Thread(target=self._refresh_loop, daemon=True)
 
     def start(self):
         self.refresh_loop.start()
 
+    def stop(self):
+        self.stopped.set()
+
+    def _remove_client(self, client: CachedBWSClient):
+        self.clients.remove_client(client)
+        try:
+            self.refresh_lease.release(client.client_hash)
+        except CacheBackendException:
+            logger.warning(
+                "Can't release refresh lease for client %s", client.client_hash
+            )
+
+    def _holds_lease(self, client: CachedBWSClient) -> bool:
+        try:
+            if client.holds_refresh_lease():
+                return True
+            logger.debug(
+                "Client %s is refreshed by another replica", client.client_hash
+            )
+        except CacheBackendException:
+            logger.warning(
+                "Can't acquire refresh lease for client %s skipping...",
+                client.client_hash,
+            )
+        return False
+
+    def _renew_leases(self, clients: list[CachedBWSClient]) -> set[str]:
+        """Take or extend every client's lease, returning the hashes of those held."""
+        held = {client.client_hash for client in clients if self._holds_lease(client)}
+        for client in clients:
+            if client.client_hash not in held and client.refresh_due():
+                self.prom_client.tick_refresh("skipped")
+        return held
+
+    def _refresh_client(self, client: CachedBWSClient, period: float):
+        logger.debug("Refreshing client id: %s", client.client_hash)
+        self.prom_client.tick_refresh("refreshed")
+        try:
+            changed = client.refresh_cache()
+            avoided = client.schedule_refresh(changed, period)
+            self.prom_client.tick_refresh_syncs_avoided(avoided)
+        except BWSAPIRateLimitExceededException:
+            logger.info("Rate limit exceeded for client %s", client.client_hash)
+            self.stopped.wait(30)
+        except InvalidTokenException:
+            logger.error("Invalid token for client %s", client.client_hash)
+            self._remove_client(client)
+        except SendRequestException:
+            logger.info(
+                "Can't sent request to upstream for client for client %s skipping...",
+                client.client_hash,
+            )
+        except CacheBackendException:
+            logger.warning(
+                "Can't write to cache backend for client %s skipping...",
+                client.client_hash,
+            )
+        except Exception:
+            logger.exception("Error occurred while refreshing client.")
+            self._remove_client(client)
+
     def _refresh_loop(self):
-        while True:
+        held: set[str] = set()
+        renew_at = 0.0
+        while not self.stopped.is_set():
             clients = self.clients.list_clients()
-            if clients:
-                logger.debug("Refreshing %s clients.", len(clients))
-                for client in clients:
-                    logger.debug("Refreshing client id: %s", client.client_hash)
-                    try:
-                        client.refresh_cache()
-                    except BWSAPIRateLimitExceededException:
-                        logger.info(
-                            "Rate limit exceeded for client %s", client.client_hash
-                        )
-                        time.sleep(30)
-                    except InvalidTokenException:
-                        logger.error("Invalid token for client %s", client.client_hash)
-                        self.clients.remove_client(client)
-                    except SendRequestException:
-                        logger.info(
-                            "Can't sent request to upstream for client for client %s skipping...",
-                            client.client_hash,
-                        )
-                    except Exception:
-                        logger.exception("Error occurred while refreshing client.")
-                        self.clients.remove_client(client)
-                    time.sleep(self.refresh_interval)
+            # renewed apart from refreshes, so backed off clients keep their leases
+            if time.monotonic() >= renew_at:
+                held = self._renew_leases(clients)
+                renew_at = time.monotonic() + self.refresh_interval
+            due_clients = [
+                client
+                for client in clients
+                if client.client_hash in held and client.refresh_due()
+            ]
+            if due_clients:
+                logger.debug("Refreshing %s due clients.", len(due_clients))
+                # one client per interval, the longest waiting first
+                client = min(due_clients, key=lambda client: client.next_refresh)
+                self._refresh_client(client, self.refresh_interval * len(clients))
+                self.stopped.wait(self.refresh_interval)
             else:
-                time.sleep(1)
+                self.stopped.wait(1)
+
+
+class TokenRenewer:
+    def __init__(self, client_list: ClientList, prom_client: PromMetricsClient):
+        self.clients = client_list
+        self.prom_client = prom_client
+        self.stopped = Event()
+        self.renew_loop = Thread(target=self._renew_loop, daemon=True)
+
+    def start(self):
+        self.renew_loop.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _renew_client(self, client: CachedBWSClient):
+        logger.debug("Renewing token for client %s", client.client_hash)
+        st = time.perf_counter()
+        try:
+            client.client.renew_token()
+        except Exception as e:
+            logger.warning(
+                "Token renewal failed for client %s: %s", client.client_hash, e
+            )
+            self.prom_client.tick_token_renewal_failure(type(e).__name__)
+            client.client.retry_renewal()
+        finally:
+            self.prom_client.tick_token_renewal_duration(time.perf_counter() - st)
+
+    def _renew_loop(self):
+        while not self.stopped.is_set():
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            for client in self.clients.list_clients():
+                if client.client.renew_at <= now:
+                    self._renew_client(client)
+            self.stopped.wait(1)
 
 
 class BwsClientManager:
@@ -362,44 +698,197 @@ class BwsClientManager:
         prom_client: PromMetricsClient,
         default_region: Region | None,
         secret_refresh_interval: int,
+        cache_backend_factory: CacheBackendFactory | None = None,
+        refresh_lease: RefreshLease | None = None,
+        auth_workers: int = 4,
+        auth_timeout: float = 30,
+        default_projects: frozenset[str] | None = None,
     ):
         self.region = default_region
+        self.projects = default_projects
         self.prom_client = prom_client
+        self.cache_backend_factory = cache_backend_factory
+        self.auth_timeout = auth_timeout
+        self.auth_executor = ThreadPoolExecutor(
+            max_workers=auth_workers, thread_name_prefix="bws-auth"
+        )
+        self._pending_clients: dict[str, Future[CachedBWSClient]] = {}
+        self._pending_clients_lock = RLock()
+        self.refresh_lease = refresh_lease or LocalRefreshLease()
+        self.lease_ttl = secret_refresh_interval * LEASE_TTL_INTERVALS + LEASE_TTL_GRACE
         self.client_list = self._make_client_list()
-        self.refresher = self._make_refresher(secret_refresh_interval, self.client_list)
+        self.renewer = self._make_renewer(self.client_list, prom_client)
+        self.refresher = self._make_refresher(
+            secret_refresh_interval,
+            self.client_list,
+            prom_client,
+            self.refresh_lease,
+        )
 
     @staticmethod
-    def _make_refresher(refresh_interval: int, client_list: ClientList):
-        refresher = CachedClientRefresher(refresh_interval, client_list)
+    def _make_refresher(
+        refresh_interval: int,
+        client_list: ClientList,
+        prom_client: PromMetricsClient,
+        refresh_lease: RefreshLease,
+    ):
+        refresher = CachedClientRefresher(
+            refresh_interval, client_list, prom_client, refresh_lease
+        )
         refresher.start()
         return refresher
 
+    @staticmethod
+    def _make_renewer(client_list: ClientList, prom_client: PromMetricsClient):
+        renewer = TokenRenewer(client_list, prom_client)
+        renewer.start()
+        return renewer
+
     @staticmethod
     def _make_client_list():
         return ClientList()
 
-    def _make_client(self, bws_secret_token: str, region: Region):
-        client = CachedBWSClient(bws_secret_token, region, self.prom_client)
+    def _make_client(
+        self, bws_secret_token: str, region: Region, projects: frozenset[str] | None
+    ):
+        st = time.perf_counter()
+        try:
+            client = CachedBWSClient(
+                bws_secret_token,
+                region,
+                self.prom_client,
+                self.cache_backend_factory,
+                projects,
+                self.refresh_lease,
+                self.lease_ttl,
+            )
+        except Exception as e:
+            self.prom_client.tick_client_auth_failure(type(e).__name__)
+            raise
+        finally:
+            self.prom_client.tick_client_auth_duration(time.perf_counter() - st)
         return client
 
-    def get_client(self, bws_secret_token, region: Region | None) -> CachedBWSClient:
+    def _client_ready(self, client_hash: str, future: "Future[CachedBWSClient]"):
+        with self._pending_clients_lock:
+            # cancelled when shutting down with authentications still queued
+            if not future.cancelled() and future.exception() is None:
+                self.client_list.add_client(future.result())
+            self._pending_clients.pop(client_hash, None)
+
+    def _pending_client(
+        self, bws_secret_token: str, region: Region, projects: frozenset[str] | None
+    ) -> "CachedBWSClient | Future[CachedBWSClient]":
+        client_hash = generate_hash(bws_secret_token, region, projects)
+        with self._pending_clients_lock:
+            # re-checked under the lock in case a pending client just finished
+            client = self.client_list.get(bws_secret_token, region, projects)
+            if client is not None:
+                return client
+            future = self._pending_clients.get(client_hash)
+            if future is None:
+                logger.debug("Creating new client")
+                future = self.auth_executor.submit(
+                    self._make_client, bws_secret_token, region, projects
+                )
+                self._pending_clients[client_hash] = future
+                future.add_done_callback(
+                    functools.partial(self._client_ready, client_hash)
+                )
+            else:
+                logger.debug("Waiting for pending client %s", client_hash)
+        return future
+
+    def _auth_timed_out(self, client_hash: str) -> ClientAuthTimeoutException:
+        logger.warning("Timed out authenticating client %s", client_hash)
+        self.prom_client.tick_client_auth_failure("timeout")
+        return ClientAuthTimeoutException("Timed out authenticating with BWS")
+
+    def _get_pending_client(
+        self, bws_secret_token: str, region: Region, projects: frozenset[str] | None
+    ) -> CachedBWSClient:
+        pending = self._pending_client(bws_secret_token, region, projects)
+        if not isinstance(pending, Future):
+            return pending
+        try:
+            return pending.result(timeout=self.auth_timeout)
+        except TimeoutError:
+            raise self._auth_timed_out(
+                generate_hash(bws_secret_token, region, projects)
+            )
+
+    async def _await_pending_client(
+        self, bws_secret_token: str, region: Region, projects: frozenset[str] | None
+    ) -> CachedBWSClient:
+        pending = self._pending_client(bws_secret_token, region, projects)
+        if not isinstance(pending, Future):
+            return pending
+        try:
+            # shielded so a request that times out or disconnects doesn't cancel
+            # an authentication other requests are waiting on
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(pending)), self.auth_timeout
+            )
+        except TimeoutError:
+            raise self._auth_timed_out(
+                generate_hash(bws_secret_token, region, projects)
+            )
+
+    def _client_scope(
+        self, region: Region | None, projects: frozenset[str] | None
+    ) -> tuple[Region, frozenset[str] | None]:
         if region is None:
             if self.region is None:
                 raise NoDefaultRegionException("Default region is not set")
             region = self.region
+        if projects is None:
+            projects = self.projects
+        return region, projects
 
-        client = self.client_list.get(bws_secret_token, region)
-        if client is None:
-            logger.debug("Creating new client")
-            client = self._make_client(bws_secret_token, region)
+    def get_client(
+        self,
+        bws_secret_token,
+        region: Region | None,
+        projects: frozenset[str] | None = None,
+    ) -> CachedBWSClient:
+        region, projects = self._client_scope(region, projects)
+        with profiler.stage("get_client"):
+            client = self.client_list.get(bws_secret_token, region, projects)
+            if client is None:
+                client = self._get_pending_client(bws_secret_token, region, projects)
+        return client
 
-            self.client_list.add_client(client)
+    async def get_client_async(
+        self,
+        bws_secret_token,
+        region: Region | None,
+        projects: frozenset[str] | None = None,
+    ) -> CachedBWSClient:
+        """Like get_client, but waits for a new client on the event loop."""
+        region, projects = self._client_scope(region, projects)
+        with profiler.stage("get_client"):
+            client = self.client_list.get(bws_secret_token, region, projects)
+            if client is None:
+                client = await self._await_pending_client(
+                    bws_secret_token, region, projects
+                )
         return client
 
+    def shutdown(self):
+        self.refresher.stop()
+        self.renewer.stop()
+        self.auth_executor.shutdown(wait=False, cancel_futures=True)
+
     def stats(self) -> StatsResponse:
         clients_stats: dict[str, CacheStats] = {}
-        for client in self.client_list.list_clients():
-            clients_stats[client.client_hash] = client.stats()
+        clients = self.client_list.list_clients()
+        for client in clients:
+            try:
+                clients_stats[client.client_hash] = client.stats()
+            except CacheBackendException:
+                logger.warning(
+                    "Can't get cache stats for client %s", client.client_hash
+                )
 
         secret_cache_size_sum = 0
         keymap_cache_size_sum = 0
@@ -413,7 +902,7 @@ class BwsClientManager:
         )
 
         return StatsResponse(
-            num_clients=len(clients_stats),
+            num_clients=len(clients),
             client_stats=clients_stats,
             total_stats=total_stats,
         )
@@ -0,0 +1,81 @@
+import functools
+import gzip
+import importlib.util
+import os
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+try:
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+except ValueError:
+    raise ValueError("COMPRESSION_MIN_SIZE must be an integer")
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+ZSTD_AVAILABLE = importlib.util.find_spec("zstandard") is not None
+MSGPACK_AVAILABLE = importlib.util.find_spec("msgpack") is not None
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def _accepted(header: str) -> dict[str, float]:
+    accepted: dict[str, float] = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    accepted = _accepted(accept_encoding)
+    supported = ("zstd", "gzip") if ZSTD_AVAILABLE else ("gzip",)
+    # max keeps the first of equal qualities, so the order only breaks ties
+    encoding = max(supported, key=lambda name: accepted.get(name, 0))
+    if accepted.get(encoding, 0) > 0:
+        return encoding
+    return None
+
+
+def wants_msgpack(accept: str | None) -> bool:
+    if not MSGPACK_AVAILABLE or not accept:
+        return False
+    accepted = _accepted(accept)
+    return any(accepted.get(media_type, 0) > 0 for media_type in MSGPACK_MEDIA_TYPES)
+
+
+@functools.cache
+def _zstd_compressor():
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return _zstd_compressor().compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_body(data: bytes, accept_encoding: str | None) -> tuple[bytes, str | None]:
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None or len(data) < COMPRESSION_MIN_SIZE:
+        return data, None
+    return compress(data, encoding), encoding
+
+
+def pack_msgpack(data) -> bytes:
+    import msgpack
+
+    packed = msgpack.packb(data)
+    # packb only returns None when handed a custom stream writer
+    assert packed is not None
+    return packed
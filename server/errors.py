@@ -1,3 +1,6 @@
+import math
+
+
 class InvalidTokenException(Exception):
     pass
 
@@ -28,3 +31,28 @@ class InvalidSecretIDException(Exception):
 
 class NoDefaultRegionException(Exception):
     pass
+
+
+class InvalidKeyQueryException(Exception):
+    pass
+
+
+class CacheBackendException(Exception):
+    pass
+
+
+class UnknownProjectException(Exception):
+    pass
+
+
+class ClientAuthTimeoutException(Exception):
+    pass
+
+
+class ThrottledException(Exception):
+    def __init__(self, scope: str, tenant: str, reason: str, retry_after: float):
+        super().__init__(f"{scope} {tenant} is over its {reason} limit")
+        self.scope = scope
+        self.tenant = tenant
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
@@ -0,0 +1,85 @@
+import fnmatch
+import re
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable
+
+GLOB_SPECIAL_CHARS = "*?["
+
+
+def glob_literal_prefix(pattern: str) -> str:
+    for index, char in enumerate(pattern):
+        if char in GLOB_SPECIAL_CHARS:
+            return pattern[:index]
+    return pattern
+
+
+class SortedKeyIndex:
+    """Sorted list of secret keys supporting prefix and glob range scans.
+
+    Not thread safe, callers are expected to hold the owning cache lock.
+    """
+
+    def __init__(self):
+        self._keys: list[str] = []
+        self._members: set[str] = set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key: str):
+        return key in self._members
+
+    def add(self, key: str):
+        if key not in self._members:
+            self._members.add(key)
+            insort(self._keys, key)
+
+    def update(self, keys: Iterable[str]):
+        new_keys = [key for key in set(keys) if key not in self._members]
+        if not new_keys:
+            return
+        self._members.update(new_keys)
+        self._keys.extend(new_keys)
+        self._keys.sort()
+
+    def remove(self, key: str):
+        if key in self._members:
+            self._members.discard(key)
+            del self._keys[bisect_left(self._keys, key)]
+
+    def clear(self):
+        self._keys = []
+        self._members = set()
+
+    def _range(self, prefix: str, cursor: str | None) -> tuple[int, int]:
+        start = bisect_left(self._keys, prefix)
+        if cursor is not None:
+            start = max(start, bisect_right(self._keys, cursor))
+        if prefix:
+            # every key starting with prefix sorts below prefix + the max code point
+            end = bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+        else:
+            end = len(self._keys)
+        return start, end
+
+    def prefix(
+        self, prefix: str, limit: int, cursor: str | None = None
+    ) -> tuple[list[str], str | None]:
+        start, end = self._range(prefix, cursor)
+        page = self._keys[start : min(end, start + limit)]
+        next_cursor = page[-1] if page and start + limit < end else None
+        return page, next_cursor
+
+    def glob(
+        self, pattern: str, limit: int, cursor: str | None = None
+    ) -> tuple[list[str], str | None]:
+        matcher = re.compile(fnmatch.translate(pattern))
+        start, end = self._range(glob_literal_prefix(pattern), cursor)
+        page: list[str] = []
+        for index in range(start, end):
+            key = self._keys[index]
+            if matcher.match(key):
+                if len(page) == limit:
+                    return page, page[-1]
+                page.append(key)
+        return page, None
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class MissBatcher(Generic[T]):
+    """Collects cache misses over a short window and resolves them together.
+
+    The first miss of a batch waits for the window to pass, or until the interval
+    since the last batch has, then resolves every miss collected meanwhile with
+    one call. Concurrent misses for the same item share one result, and every
+    waiting request gets the resolver's result or exception.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[list[str]], dict[str, T]],
+        window: float,
+        interval: float = 0,
+    ):
+        self._resolve = resolve
+        self._window = window
+        self._interval = interval
+        self._last_batch = float("-inf")
+        self._pending: dict[str, Future[T | None]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, item: str) -> T | None:
+        with self._lock:
+            leader = not self._pending
+            future = self._pending.get(item)
+            if future is None:
+                future = self._pending[item] = Future()
+        if leader:
+            # a new leader only appears once the previous batch is taken
+            time.sleep(
+                max(self._window, self._last_batch + self._interval - time.monotonic())
+            )
+            self._resolve_pending()
+        return future.result()
+
+    def _resolve_pending(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._last_batch = time.monotonic()
+        try:
+            results = self._resolve(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+        else:
+            for item, future in batch.items():
+                future.set_result(results.get(item))
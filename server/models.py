@@ -35,3 +35,24 @@ class StatsResponse(BaseModel):
     num_clients: int
     client_stats: dict[str, CacheStats]
     total_stats: CacheStats
+
+
+class SecretListResponse(BaseModel):
+    secrets: list[SecretResponse]
+    next_cursor: str | None
+
+
+class StageTimings(BaseModel):
+    count: int
+    total: float
+    mean: float
+    max: float
+
+
+class Span(BaseModel):
+    name: str
+    span_id: str
+    start: float
+    duration: float
+    status: str
+    attributes: dict[str, str]
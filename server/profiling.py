@@ -0,0 +1,207 @@
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, deque
+
+logger = logging.getLogger("bwscache.profiling")
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+
+MAX_RECORDED_SPANS = 256
+MAX_PROFILE_SECONDS = 60
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class TimedLock:
+    """Lock that records how long callers waited to acquire it."""
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self._lock = threading.Lock()
+        self._profiler = profiler
+        self._name = name
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        st = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self._profiler.record(f"lock_wait:{self._name}", time.perf_counter() - st)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Profiler:
+    """Opt-in request pipeline instrumentation.
+
+    Every hook returns a shared no-op when profiling is disabled so the hot path
+    only pays for an attribute lookup and a function call.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._stats: dict[str, list[float]] = {}
+        self._stats_lock = threading.Lock()
+        self._spans: deque[dict] = deque(maxlen=MAX_RECORDED_SPANS)
+        self._profile_lock = threading.Lock()
+        self._stage_histogram = None
+        self._tracer = None
+        if enabled:
+            self._setup()
+
+    def _setup(self):
+        from prometheus_client import Histogram
+
+        self._stage_histogram = Histogram(
+            "profile_stage_duration", "request pipeline stage duration", ["stage"]
+        )
+        try:
+            from opentelemetry import trace
+
+            self._tracer = trace.get_tracer("bws-cache")
+            logger.info("Exporting upstream spans with OpenTelemetry")
+        except ImportError:
+            logger.debug("opentelemetry not installed, keeping spans in memory only")
+
+    def record(self, stage: str, duration: float):
+        with self._stats_lock:
+            stats = self._stats.setdefault(stage, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+        if self._stage_histogram is not None:
+            self._stage_histogram.labels(stage=stage).observe(duration)
+
+    @contextlib.contextmanager
+    def _timed_stage(self, name: str):
+        st = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - st)
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed_stage(name)
+
+    def make_lock(self, name: str):
+        if not self.enabled:
+            return threading.Lock()
+        return TimedLock(self, name)
+
+    @contextlib.contextmanager
+    def _recorded_span(self, name: str, attributes: dict[str, str]):
+        span = {
+            "name": name,
+            "span_id": uuid.uuid4().hex[:16],
+            "start": time.time(),
+            "attributes": attributes,
+            "status": "ok",
+        }
+        otel_span = (
+            self._tracer.start_as_current_span(name, attributes=attributes)
+            if self._tracer is not None
+            else _NULL_CONTEXT
+        )
+        st = time.perf_counter()
+        try:
+            with otel_span:
+                yield
+        except Exception as e:
+            span["status"] = f"error: {type(e).__name__}"
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - st
+            self._spans.append(span)
+            self.record(name, span["duration"])
+
+    def span(self, name: str, **attributes: str):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._recorded_span(name, attributes)
+
+    def timings(self) -> dict[str, dict[str, float]]:
+        with self._stats_lock:
+            return {
+                stage: {
+                    "count": count,
+                    "total": total,
+                    "mean": total / count if count else 0.0,
+                    "max": maximum,
+                }
+                for stage, (count, total, maximum) in self._stats.items()
+            }
+
+    def spans(self) -> list[dict]:
+        return list(self._spans)
+
+    def cpu_profile(self, seconds: float, interval: float) -> str | None:
+        """Sample every thread's stack, returning collapsed stacks for flamegraphs."""
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        try:
+            samples: Counter[str] = Counter()
+            current_thread = threading.get_ident()
+            deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == current_thread:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(
+                            f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+                        )
+                        frame = frame.f_back
+                    samples[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return "\n".join(f"{stack} {count}" for stack, count in samples.items())
+        finally:
+            self._profile_lock.release()
+
+    def allocation_profile(self, seconds: float, limit: int) -> str | None:
+        """Trace allocations for a while, returning the largest allocation sites."""
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        try:
+            already_tracing = tracemalloc.is_tracing()
+            if not already_tracing:
+                tracemalloc.start(25)
+            try:
+                before = tracemalloc.take_snapshot()
+                time.sleep(min(seconds, MAX_PROFILE_SECONDS))
+                after = tracemalloc.take_snapshot()
+            finally:
+                if not already_tracing:
+                    tracemalloc.stop()
+            stats = after.compare_to(before, "traceback")[:limit]
+            lines = []
+            for stat in stats:
+                lines.append(
+                    f"{stat.size_diff} B in {stat.count_diff} blocks "
+                    f"(total {stat.size} B in {stat.count} blocks)"
+                )
+                lines.extend(f"    {line}" for line in stat.traceback.format())
+            return "\n".join(lines)
+        finally:
+            self._profile_lock.release()
+
+
+profiler = Profiler(PROFILING_ENABLED)
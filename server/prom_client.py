@@ -1,5 +1,7 @@
+import functools
+
 from models import StatsResponse
-from prometheus_client import REGISTRY, Counter, Gauge
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
 from prometheus_client.exposition import choose_encoder
 
 
@@ -14,6 +16,35 @@ class PromMetricsClient:
         self.http_request_total = Counter(
             "http_request_total", "http request total", ["endpoint", "status_code"]
         )
+        self.refresh_total = Counter(
+            "refresh_total", "background client refreshes", ["result"]
+        )
+        self.refresh_syncs_avoided = Counter(
+            "refresh_syncs_avoided", "upstream syncs skipped while secrets are stable"
+        )
+        self.client_auth_duration = Histogram(
+            "client_auth_duration", "time taken to create and authenticate a client"
+        )
+        self.client_auth_failures = Counter(
+            "client_auth_failures", "failed client authentications", ["reason"]
+        )
+        self.token_renewal_duration = Histogram(
+            "token_renewal_duration", "time taken to renew a client access token"
+        )
+        self.token_renewal_failures = Counter(
+            "token_renewal_failures", "failed access token renewals", ["reason"]
+        )
+        self.miss_batch_size = Histogram(
+            "miss_batch_size",
+            "cache misses resolved by one upstream call",
+            ["type"],
+            buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+        )
+        self.throttled_requests = Counter(
+            "throttled_requests",
+            "requests rejected for being over a request limit",
+            ["scope", "tenant", "reason"],
+        )
         self.http_request_duration = Gauge(
             "http_request_duration", "http request duration", ["endpoint"]
         )
@@ -30,6 +61,30 @@ class PromMetricsClient:
     def tick_http_request_duration(self, endpoint: str, duration):
         self.http_request_duration.labels(endpoint=endpoint).set(duration)
 
+    def tick_refresh(self, result: str):
+        self.refresh_total.labels(result=result).inc()
+
+    def tick_refresh_syncs_avoided(self, count: int):
+        self.refresh_syncs_avoided.inc(count)
+
+    def tick_client_auth_duration(self, duration: float):
+        self.client_auth_duration.observe(duration)
+
+    def tick_client_auth_failure(self, reason: str):
+        self.client_auth_failures.labels(reason=reason).inc()
+
+    def tick_token_renewal_duration(self, duration: float):
+        self.token_renewal_duration.observe(duration)
+
+    def tick_token_renewal_failure(self, reason: str):
+        self.token_renewal_failures.labels(reason=reason).inc()
+
+    def tick_miss_batch(self, type: str, size: int):
+        self.miss_batch_size.labels(type=type).observe(size)
+
+    def tick_throttled(self, scope: str, tenant: str, reason: str):
+        self.throttled_requests.labels(scope=scope, tenant=tenant, reason=reason).inc()
+
     def tick_stats(self, stats: StatsResponse):
         self.num_clients.set(stats.num_clients)
         for client, client_stats in stats.client_stats.items():
@@ -50,3 +105,9 @@ class PromMetricsClient:
         generate_latest, content_type = choose_encoder(accept_header)
         generated_content = generate_latest(self.REGISTRY).decode("utf-8")
         return generated_content, content_type
+
+
+@functools.cache
+def get_metrics_client() -> PromMetricsClient:
+    """The process's metrics client, as its metrics live in the global registry."""
+    return PromMetricsClient()
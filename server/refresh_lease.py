@@ -0,0 +1,99 @@
+import functools
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+
+from cache_backend import get_redis_client
+from errors import CacheBackendException
+
+logger = logging.getLogger("bwscache.refresh_lease")
+
+# take the lease if it's free, or extend it if we already hold it
+ACQUIRE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RefreshLease(ABC):
+    """Decides which replica refreshes a client from upstream."""
+
+    @abstractmethod
+    def acquire(self, client_hash: str, ttl: float) -> bool: ...
+
+    @abstractmethod
+    def release(self, client_hash: str): ...
+
+
+class LocalRefreshLease(RefreshLease):
+    """Single replica deployments always hold every lease."""
+
+    def acquire(self, client_hash: str, ttl: float) -> bool:
+        return True
+
+    def release(self, client_hash: str):
+        pass
+
+
+class RedisRefreshLease(RefreshLease):
+    def __init__(self, redis_client):
+        from redis import RedisError
+
+        self.redis = redis_client
+        self.redis_error = RedisError
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+        self._acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def _handle_redis_errors(func):
+        @functools.wraps(func)
+        def wrapper(self: "RedisRefreshLease", *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            except self.redis_error as e:
+                logger.error("Redis refresh lease request failed: %s", e)
+                raise CacheBackendException("Refresh lease unavailable") from e
+
+        return wrapper
+
+    @staticmethod
+    def _lease_key(client_hash: str):
+        return f"bwscache:{client_hash}:lease"
+
+    @_handle_redis_errors
+    def acquire(self, client_hash: str, ttl: float) -> bool:
+        return bool(
+            self._acquire(
+                keys=[self._lease_key(client_hash)], args=[self.owner, int(ttl * 1000)]
+            )
+        )
+
+    @_handle_redis_errors
+    def release(self, client_hash: str):
+        self._release(keys=[self._lease_key(client_hash)], args=[self.owner])
+
+
+def make_refresh_lease(coordination: str, redis_url: str | None) -> RefreshLease:
+    if coordination == "none":
+        return LocalRefreshLease()
+    elif coordination == "redis":
+        if not redis_url:
+            raise ValueError("REDIS_URL must be set when REFRESH_COORDINATION is redis")
+        logger.info("Using redis refresh leases")
+        return RedisRefreshLease(get_redis_client(redis_url))
+    raise ValueError("REFRESH_COORDINATION must be one of none or redis")
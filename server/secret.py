@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+from compression import COMPRESSION_MIN_SIZE, choose_encoding, compress
+from value_store import EncodedSecret, StoredSecret, ValueStore
+
+logger = logging.getLogger("bwscache.secret")
+
+PARSE_SECRET_VALUES = os.environ.get("PARSE_SECRET_VALUES", "false").lower() == "true"
+
+
+@dataclass(slots=True, frozen=True)
+class SecretMetaData:
+    key: str
+    id: str
+
+
+class SecretResponse:
+    __slots__ = ("_compressed", "_metadata", "_value")
+
+    def __init__(self, metadata: SecretMetaData, value: str | EncodedSecret | None):
+        self._metadata = metadata
+        self._value = value
+        self._compressed: dict[str, bytes] | None = None
+
+    @property
+    def metadata(self):
+        return self._metadata
+
+    @property
+    def key(self):
+        return self._metadata.key
+
+    @property
+    def id(self):
+        return self._metadata.id
+
+    @property
+    def raw_value(self) -> str | None:
+        value = self._value
+        if isinstance(value, EncodedSecret):
+            return value.value()
+        return value
+
+    def stored(self, store: ValueStore) -> "SecretResponse":
+        return SecretResponse(
+            self._metadata, store.put(self.id, self.key, self.raw_value)
+        )
+
+    @property
+    def value(self):
+        data = self.raw_value
+        if data is not None:
+            if not PARSE_SECRET_VALUES:
+                return data
+            else:
+                try:
+                    data = json.loads(data)
+                    logger.debug("JSON parse succeeded")
+                    return data
+                except json.JSONDecodeError:
+                    logger.debug("JSON parse failed... trying yaml")
+                # only imported when needed as it's slow to import
+                import yaml
+
+                try:
+                    data = yaml.safe_load(data)
+                    logger.debug("YAML parse succeeded")
+                    return data
+                except yaml.YAMLError:
+                    logger.debug("YAML parse failed... return raw secret")
+        else:
+            logger.info("Secret not found")
+        return None
+
+    def to_json(self):
+        return {"key": self.key, "id": self.id, "value": self.value}
+
+    def to_json_bytes(self) -> bytes:
+        if isinstance(self._value, EncodedSecret) and not PARSE_SECRET_VALUES:
+            return self._value.json_bytes()
+        return json.dumps(self.to_json()).encode("utf-8")
+
+    def encoded_json_bytes(
+        self, accept_encoding: str | None
+    ) -> tuple[bytes, str | None]:
+        """JSON body compressed with the best encoding the client accepts.
+
+        Compressed bodies of cached secrets are kept for reuse, except when the
+        cache is encrypted as they would hold the secret in a recoverable form.
+        """
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            return self.to_json_bytes(), None
+        compressed = self._compressed
+        if compressed is not None and encoding in compressed:
+            return compressed[encoding], encoding
+        data = self.to_json_bytes()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return data, None
+        data = compress(data, encoding)
+        if isinstance(self._value, StoredSecret) and not self._value.encrypted:
+            if compressed is None:
+                compressed = self._compressed = {}
+            compressed[encoding] = data
+        return data, encoding
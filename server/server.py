@@ -1,27 +1,50 @@
 import functools
+import hmac
+import json
 import logging
 import os
 import time
+from contextlib import asynccontextmanager
 from typing import Annotated
 
+from admission import AdmissionController, Limits
 from bws_sdk import BWSSDKError
+from cache_backend import make_cache_backend_factory
 from client import (
     REGION_MAPPING,
     BwsClientManager,
+    CachedBWSClient,
     Region,
     RegionEnum,
+    generate_hash,
+    is_valid_uuid,
 )
+from compression import compress_body, pack_msgpack, wants_msgpack
 from errors import (
     BWSAPIRateLimitExceededException,
+    CacheBackendException,
+    ClientAuthTimeoutException,
+    InvalidKeyQueryException,
     InvalidSecretIDException,
     InvalidTokenException,
     MissingSecretException,
     NoDefaultRegionException,
     SendRequestException,
+    ThrottledException,
     UnauthorizedTokenException,
     UnknownKeyException,
+    UnknownProjectException,
+)
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
 )
-from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import PlainTextResponse
 from models import (
@@ -29,16 +52,19 @@ from models import (
     ErrorResponse,
     HealthcheckResponse,
     ResetResponse,
+    SecretListResponse,
     SecretResponse,
+    Span,
+    StageTimings,
     StatsResponse,
 )
-from prom_client import PromMetricsClient
+from profiling import profiler
+from prom_client import PromMetricsClient, get_metrics_client
+from refresh_lease import make_refresh_lease
 from version import VERSION
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
 
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-root_logger = logging.getLogger()
 logger = logging.getLogger("bwscache.server")
 
 mode_mapping = {
@@ -49,20 +75,28 @@ mode_mapping = {
     "CRITICAL": logging.CRITICAL,
 }
 
-if root_logger.level == logging.DEBUG:
-    formatter = logging.Formatter(
-        "[%(asctime)s] {%(pathname)s:%(lineno)d} %(name)s:%(levelname)s - %(message)s",
-        "%m-%d %H:%M:%S",
-    )
-else:
-    formatter = logging.Formatter("%(asctime)s - %(name)s:%(levelname)s - %(message)s")
 
-ch = logging.StreamHandler()
-ch.setFormatter(formatter)
-root_logger.addHandler(ch)
+# once per process, as create_app can be called more than once
+@functools.cache
+def setup_logging():
+    root_logger = logging.getLogger()
+    if root_logger.level == logging.DEBUG:
+        formatter = logging.Formatter(
+            "[%(asctime)s] {%(pathname)s:%(lineno)d} %(name)s:%(levelname)s - %(message)s",
+            "%m-%d %H:%M:%S",
+        )
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s:%(levelname)s - %(message)s"
+        )
+
+    ch = logging.StreamHandler()
+    ch.setFormatter(formatter)
+    root_logger.addHandler(ch)
+
+    root_logger.setLevel(mode_mapping[LOG_LEVEL])
+    logger.info("Logging level set to %s", LOG_LEVEL)
 
-root_logger.setLevel(mode_mapping[LOG_LEVEL])
-logger.info("Logging level set to %s", LOG_LEVEL)
 
 REFRESH_RATE = int(os.environ.get("REFRESH_RATE", "10"))
 REGION_ENV = os.environ.get("BWS_REGION", "DEFAULT").upper()
@@ -84,7 +118,10 @@ except KeyError:
     else:
         raise ValueError("a Unknown region was provided")
 
-if os.environ.get("ENABLE_TELEMETRY", "false").lower() == "true":
+ENABLE_TELEMETRY = os.environ.get("ENABLE_TELEMETRY", "false").lower() == "true"
+
+
+def setup_telemetry():
     import sentry_sdk
 
     sentry_sdk.init(
@@ -96,7 +133,7 @@ if os.environ.get("ENABLE_TELEMETRY", "false").lower() == "true":
     )
 
 
-api = FastAPI()
+router = APIRouter()
 
 
 refresh_keymap_on_miss = os.environ.get("REFRESH_KEYMAP_ON_MISS", "").lower() == "true"
@@ -112,45 +149,184 @@ else:
     SECRET_INFO_TTL = 600
 
 
-prom_client = PromMetricsClient()
-client_manager = BwsClientManager(prom_client, DEFAULT_REGION, REFRESH_RATE)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.environ.get("REDIS_URL")
+REFRESH_COORDINATION = os.environ.get("REFRESH_COORDINATION", "none").lower()
+if REFRESH_COORDINATION != "none" and CACHE_BACKEND == "memory":
+    raise ValueError("REFRESH_COORDINATION requires a shared CACHE_BACKEND")
+
+try:
+    CLIENT_AUTH_WORKERS = int(os.environ.get("CLIENT_AUTH_WORKERS", "4"))
+    CLIENT_AUTH_TIMEOUT = float(os.environ.get("CLIENT_AUTH_TIMEOUT", "30"))
+except ValueError:
+    raise ValueError("CLIENT_AUTH_WORKERS and CLIENT_AUTH_TIMEOUT must be numbers")
+
+
+def parse_projects(value: str) -> frozenset[str] | None:
+    projects = frozenset(
+        project.strip().lower() for project in value.split(",") if project.strip()
+    )
+    if not all(is_valid_uuid(project) for project in projects):
+        raise ValueError("project IDs must be UUIDs")
+    return projects or None
+
+
+try:
+    DEFAULT_PROJECTS = parse_projects(os.environ.get("BWS_PROJECTS", ""))
+except ValueError:
+    raise ValueError("BWS_PROJECTS must be a comma separated list of project IDs")
+
+try:
+    TOKEN_LIMITS = Limits(
+        int(os.environ.get("TOKEN_CONCURRENCY_LIMIT", "0")),
+        float(os.environ.get("TOKEN_RATE_LIMIT", "0")),
+    )
+    REGION_LIMITS = Limits(
+        int(os.environ.get("REGION_CONCURRENCY_LIMIT", "0")),
+        float(os.environ.get("REGION_RATE_LIMIT", "0")),
+    )
+except ValueError:
+    raise ValueError("TOKEN_* and REGION_* request limits must be numbers")
+
+PROFILING_ADMIN_TOKEN = os.environ.get("PROFILING_ADMIN_TOKEN", "")
+if profiler.enabled and not PROFILING_ADMIN_TOKEN:
+    raise ValueError("PROFILING_ADMIN_TOKEN must be set when PROFILING_ENABLED is true")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prom_client = get_metrics_client()
+    client_manager = BwsClientManager(
+        prom_client,
+        DEFAULT_REGION,
+        REFRESH_RATE,
+        make_cache_backend_factory(CACHE_BACKEND, REDIS_URL),
+        make_refresh_lease(REFRESH_COORDINATION, REDIS_URL),
+        CLIENT_AUTH_WORKERS,
+        CLIENT_AUTH_TIMEOUT,
+        DEFAULT_PROJECTS,
+    )
+    app.state.prom_client = prom_client
+    app.state.client_manager = client_manager
+    app.state.admission = AdmissionController(TOKEN_LIMITS, REGION_LIMITS)
+    yield
+    client_manager.shutdown()
+
+
+def get_prom_client(request: Request) -> PromMetricsClient:
+    return request.app.state.prom_client
+
+
+def get_client_manager(request: Request) -> BwsClientManager:
+    return request.app.state.client_manager
+
+
+def get_admission(request: Request) -> AdmissionController:
+    return request.app.state.admission
 
 
-@api.middleware("http")
 async def prom_middleware(request: Request, call_next):
+    prom_client = get_prom_client(request)
     api_mapping = [
         "/reset",
         "/id",
         "/key",
+        "/keys",
     ]
     endpoint = None
     for api_endpoint in api_mapping:
         if request.url.path.startswith(api_endpoint):
             endpoint = request.url.path
     st = time.time()
-    return_data: Response = await call_next(request)
+    with profiler.stage("request"):
+        return_data: Response = await call_next(request)
     if endpoint and isinstance(return_data, Response):
         prom_client.tick_http_request_total(endpoint, str(return_data.status_code))
         prom_client.tick_http_request_duration(endpoint, time.time() - st)
-    prom_client.tick_stats(client_manager.stats())
     return return_data
 
 
-def custom_openapi():
-    if api.openapi_schema:
-        return api.openapi_schema
+def custom_openapi(app: FastAPI):
+    if app.openapi_schema:
+        return app.openapi_schema
     openapi_schema = get_openapi(
         title="bws-cache",
         version="1.1.0",
         summary="bws-cache OpenAPI Schema",
         description='<a href="https://github.com/rippleFCL/bws-cache">Github</a> | <a href="https://github.com/rippleFCL/bws-cache/issues">Issues</a>',
-        routes=api.routes,
+        routes=app.routes,
     )
-    api.openapi_schema = openapi_schema
-    return api.openapi_schema
+    app.openapi_schema = openapi_schema
+    return app.openapi_schema
 
 
-api.openapi = custom_openapi
+def encoded_response(
+    body: bytes,
+    encoding: str | None,
+    media_type: str = "application/json",
+    vary: str = "Accept-Encoding",
+) -> Response:
+    """Response for bodies that are already encoded, skipping model validation."""
+    headers = {"Vary": vary}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
+
+
+# errors raised by the client and BWS, which are answered with a plain text reason
+API_ERRORS = (
+    InvalidTokenException,
+    UnauthorizedTokenException,
+    BWSAPIRateLimitExceededException,
+    UnknownKeyException,
+    SendRequestException,
+    MissingSecretException,
+    InvalidSecretIDException,
+    UnknownProjectException,
+    InvalidKeyQueryException,
+    CacheBackendException,
+    ClientAuthTimeoutException,
+    NoDefaultRegionException,
+    BWSSDKError,
+)
+
+
+def api_error_response(error: Exception) -> Response:
+    if isinstance(error, InvalidTokenException):
+        return Response("Invalid token", status_code=401)
+    elif isinstance(error, UnauthorizedTokenException):
+        return Response("Unauthorized token", status_code=401)
+    elif isinstance(error, BWSAPIRateLimitExceededException):
+        return Response("Rate limited", status_code=429)
+    elif isinstance(error, UnknownKeyException):
+        return Response("Unknown key", status_code=404)
+    elif isinstance(error, SendRequestException):
+        return Response("Can't connect to bitwarden.com")
+    elif isinstance(error, MissingSecretException):
+        return Response("Secret not found", status_code=404)
+    elif isinstance(error, InvalidSecretIDException):
+        return Response("Invalid secret ID", status_code=400)
+    elif isinstance(error, UnknownProjectException):
+        return Response("Project not found", status_code=404)
+    elif isinstance(error, InvalidKeyQueryException):
+        return Response(str(error), status_code=400)
+    elif isinstance(error, CacheBackendException):
+        return Response("Cache backend unavailable", status_code=503)
+    elif isinstance(error, ClientAuthTimeoutException):
+        return Response("Timed out authenticating with BWS", status_code=504)
+    elif isinstance(error, NoDefaultRegionException):
+        return Response(
+            "No region set. Set BWS_DEFAULT_REGION environment variable for a default, provide one in the request via the X-BWS-REGION header or set X-BWS-API-URL and X-BWS-IDENTITY-URL HEADERS",
+            status_code=400,
+        )
+    elif isinstance(error, BWSSDKError):
+        logger.warning("BWS SDK error (This is a bug): %s", error)
+        return Response(f"BWS SDK error: {error}", status_code=500)
+    raise error
+
+
+async def handle_api_error(request: Request, error: Exception) -> Response:
+    return api_error_response(error)
 
 
 def handle_api_errors(func):
@@ -158,39 +334,30 @@ def handle_api_errors(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except InvalidTokenException:
-            return Response("Invalid token", status_code=401)
-        except UnauthorizedTokenException:
-            return Response("Unauthorized token", status_code=401)
-        except BWSAPIRateLimitExceededException:
-            return Response("Rate limited", status_code=429)
-        except UnknownKeyException:
-            return Response("Unknown key", status_code=404)
-        except SendRequestException:
-            return Response("Can't connect to bitwarden.com")
-        except MissingSecretException:
-            return Response("Secret not found", status_code=404)
-        except InvalidSecretIDException:
-            return Response("Invalid secret ID", status_code=400)
-        except NoDefaultRegionException:
-            return Response(
-                "No region set. Set BWS_DEFAULT_REGION environment variable for a default, provide one in the request via the X-BWS-REGION header or set X-BWS-API-URL and X-BWS-IDENTITY-URL HEADERS",
-                status_code=400,
-            )
-        except BWSSDKError as e:
-            logger.warning("BWS SDK error (This is a bug): %s", e)
-            return Response(f"BWS SDK error: {e}", status_code=500)
+        except API_ERRORS as e:
+            return api_error_response(e)
 
     return wrapper
 
 
-def handle_auth(authorization: Annotated[str, Header()]):
+async def handle_auth(authorization: Annotated[str, Header()]):
     if authorization.startswith("Bearer "):
         return authorization.split()[-1]
     raise HTTPException(status_code=401, detail="Invalid token")
 
 
-def get_region(
+def handle_admin_auth(
+    x_bws_cache_admin_token: Annotated[str | None, Header()] = None,
+):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if x_bws_cache_admin_token is None or not hmac.compare_digest(
+        x_bws_cache_admin_token, PROFILING_ADMIN_TOKEN
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+async def get_region(
     x_bws_region: Annotated[str | None, Header()] = None,
     x_bws_api_endpoint: Annotated[str | None, Header()] = None,
     x_bws_identity_endpoint: Annotated[str | None, Header()] = None,
@@ -212,23 +379,80 @@ def get_region(
     return None
 
 
-@api.get(
+async def get_projects(x_bws_projects: Annotated[str | None, Header()] = None):
+    if not x_bws_projects:
+        return None
+    try:
+        return parse_projects(x_bws_projects)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="X-BWS-PROJECTS must be a comma separated list of project IDs",
+        )
+
+
+async def admit_request(
+    request: Request,
+    authorization: Annotated[str, Depends(handle_auth)],
+    region: Annotated[Region | None, Depends(get_region)],
+    projects: Annotated[frozenset[str] | None, Depends(get_projects)],
+):
+    # async, along with its dependencies, so over limit requests never wait for
+    # a worker thread
+    admission = get_admission(request)
+    region = region or DEFAULT_REGION
+    if not admission.enabled or region is None:
+        yield
+        return
+    try:
+        # the same hash as the client, so the tenant label matches its metrics
+        slot = admission.acquire(
+            generate_hash(authorization, region, projects or DEFAULT_PROJECTS),
+            region.api_url,
+        )
+    except ThrottledException as e:
+        logger.info("Throttling request: %s", e)
+        get_prom_client(request).tick_throttled(e.scope, e.tenant, e.reason)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    try:
+        yield
+    finally:
+        admission.release(slot)
+
+
+async def get_cached_client(
+    request: Request,
+    authorization: Annotated[str, Depends(handle_auth)],
+    region: Annotated[Region | None, Depends(get_region)],
+    projects: Annotated[frozenset[str] | None, Depends(get_projects)],
+) -> CachedBWSClient:
+    # async so a new token's authentication is awaited without holding a worker
+    # thread, which requests for ready clients need
+    return await get_client_manager(request).get_client_async(
+        authorization, region, projects
+    )
+
+
+@router.get(
     "/reset",
+    dependencies=[Depends(admit_request)],
     response_model=ResetResponse,
     responses={
         401: {"model": ErrorResponse, "description": "Invalid or unauthorised token"},
         429: {
             "model": ErrorResponse,
-            "description": "BWS authentication endpoint rate limited",
+            "description": "Rate limited by BWS or over a request limit",
         },
     },
 )
 @handle_api_errors
 def reset_cache(
-    authorization: Annotated[str, Depends(handle_auth)],
-    region: Annotated[Region | None, Depends(get_region)],
+    client: Annotated[CachedBWSClient, Depends(get_cached_client)],
 ):
-    client = client_manager.get_client(authorization, region)
     stats = client.reset_cache()
     return ResetResponse(
         status="success",
@@ -237,51 +461,104 @@ def reset_cache(
     )
 
 
-@api.get(
+@router.get(
     "/id/{secret_id}",
+    dependencies=[Depends(admit_request)],
     response_model=SecretResponse,
     responses={
         401: {"model": ErrorResponse, "description": "Invalid or unauthorised token"},
         404: {"model": ErrorResponse, "description": "Secret not found"},
         429: {
             "model": ErrorResponse,
-            "description": "BWS authentication endpoint rate limited",
+            "description": "Rate limited by BWS or over a request limit",
         },
     },
 )
 @handle_api_errors
 def get_id(
-    authorization: Annotated[str, Depends(handle_auth)],
-    region: Annotated[Region | None, Depends(get_region)],
+    client: Annotated[CachedBWSClient, Depends(get_cached_client)],
     secret_id: str,
+    accept_encoding: Annotated[str | None, Header()] = None,
 ):
-    client = client_manager.get_client(authorization, region)
-    return client.get_secret_by_id(secret_id).to_json()
+    secret = client.get_secret_by_id(secret_id)
+    with profiler.stage("serialize"):
+        return encoded_response(*secret.encoded_json_bytes(accept_encoding))
 
 
-@api.get(
+@router.get(
     "/key/{secret_key}",
+    dependencies=[Depends(admit_request)],
     response_model=SecretResponse,
     responses={
         401: {"model": ErrorResponse, "description": "Invalid or unauthorised token"},
         404: {"model": ErrorResponse, "description": "Key not found"},
         429: {
             "model": ErrorResponse,
-            "description": "BWS authentication endpoint rate limited",
+            "description": "Rate limited by BWS or over a request limit",
         },
     },
 )
 @handle_api_errors
 def get_key(
-    authorization: Annotated[str, Depends(handle_auth)],
-    region: Annotated[Region | None, Depends(get_region)],
+    client: Annotated[CachedBWSClient, Depends(get_cached_client)],
     secret_key: str,
+    accept_encoding: Annotated[str | None, Header()] = None,
 ):
-    client = client_manager.get_client(authorization, region)
-    return client.get_secret_by_key(secret_key).to_json()
+    secret = client.get_secret_by_key(secret_key)
+    with profiler.stage("serialize"):
+        return encoded_response(*secret.encoded_json_bytes(accept_encoding))
 
 
-@api.get(
+@router.get(
+    "/keys",
+    dependencies=[Depends(admit_request)],
+    response_model=SecretListResponse,
+    responses={
+        400: {"model": ErrorResponse, "description": "Invalid key query"},
+        401: {"model": ErrorResponse, "description": "Invalid or unauthorised token"},
+        429: {
+            "model": ErrorResponse,
+            "description": "Rate limited by BWS or over a request limit",
+        },
+    },
+)
+@handle_api_errors
+def get_keys(
+    client: Annotated[CachedBWSClient, Depends(get_cached_client)],
+    prefix: str | None = None,
+    glob: str | None = None,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    accept: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
+):
+    secrets, next_cursor = client.query_secrets(prefix, glob, limit, cursor)
+    with profiler.stage("serialize"):
+        if wants_msgpack(accept):
+            body = pack_msgpack(
+                {
+                    "secrets": [secret.to_json() for secret in secrets],
+                    "next_cursor": next_cursor,
+                }
+            )
+            media_type = "application/msgpack"
+        else:
+            body = (
+                b'{"secrets":['
+                + b",".join(secret.to_json_bytes() for secret in secrets)
+                + b'],"next_cursor":'
+                + json.dumps(next_cursor).encode("utf-8")
+                + b"}"
+            )
+            media_type = "application/json"
+        return encoded_response(
+            *compress_body(body, accept_encoding),
+            media_type=media_type,
+            vary="Accept, Accept-Encoding",
+        )
+
+
+@router.get(
     "/metrics",
     response_class=PlainTextResponse,
     responses={
@@ -295,13 +572,20 @@ def get_key(
         },
     },
 )
-def prometheus_metrics(accept: Annotated[str | str, Header()] = ""):
+def prometheus_metrics(
+    prom_client: Annotated[PromMetricsClient, Depends(get_prom_client)],
+    client_manager: Annotated[BwsClientManager, Depends(get_client_manager)],
+    accept: Annotated[str | str, Header()] = "",
+):
+    # cache sizes can mean a cache backend round trip, so only gather them on scrape
+    with profiler.stage("stats"):
+        prom_client.tick_stats(client_manager.stats())
     generated_data, content_type = prom_client.generate_metrics(accept)
     headers = {"Content-Type": content_type}
     return PlainTextResponse(generated_data, headers=headers)
 
 
-@api.get(
+@router.get(
     "/stats",
     response_model=StatsResponse,
     responses={
@@ -313,10 +597,92 @@ def prometheus_metrics(accept: Annotated[str | str, Header()] = ""):
     },
 )
 @handle_api_errors
-def get_stats():
+def get_stats(
+    client_manager: Annotated[BwsClientManager, Depends(get_client_manager)],
+):
     return client_manager.stats()
 
 
-@api.get("/healthcheck", response_model=HealthcheckResponse)
+@router.get(
+    "/debug/timings",
+    response_model=dict[str, StageTimings],
+    dependencies=[Depends(handle_admin_auth)],
+    include_in_schema=False,
+)
+def get_timings():
+    return profiler.timings()
+
+
+@router.get(
+    "/debug/spans",
+    response_model=list[Span],
+    dependencies=[Depends(handle_admin_auth)],
+    include_in_schema=False,
+)
+def get_spans():
+    return profiler.spans()
+
+
+@router.get(
+    "/debug/profile/cpu",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(handle_admin_auth)],
+    include_in_schema=False,
+)
+def get_cpu_profile(
+    seconds: Annotated[float, Query(gt=0, le=60)] = 10,
+    interval: Annotated[float, Query(ge=0.001, le=1)] = 0.01,
+):
+    profile = profiler.cpu_profile(seconds, interval)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(
+        profile,
+        headers={"Content-Disposition": 'attachment; filename="cpu.collapsed"'},
+    )
+
+
+@router.get(
+    "/debug/profile/allocations",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(handle_admin_auth)],
+    include_in_schema=False,
+)
+def get_allocation_profile(
+    seconds: Annotated[float, Query(gt=0, le=60)] = 10,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+):
+    profile = profiler.allocation_profile(seconds, limit)
+    if profile is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(
+        profile,
+        headers={"Content-Disposition": 'attachment; filename="allocations.txt"'},
+    )
+
+
+@router.get("/healthcheck", response_model=HealthcheckResponse)
 def healthcheck():
     return {"status": "I'm alive"}
+
+
+def create_app() -> FastAPI:
+    setup_logging()
+    if ENABLE_TELEMETRY:
+        setup_telemetry()
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.middleware("http")(prom_middleware)
+    for error in API_ERRORS:
+        app.add_exception_handler(error, handle_api_error)
+    app.openapi = functools.partial(custom_openapi, app)
+    return app
+
+
+def __getattr__(name: str):
+    # keeps `uvicorn server:api` working without building the app on import
+    if name == "api":
+        global api
+        api = create_app()
+        return api
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
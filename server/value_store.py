@@ -0,0 +1,105 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+NONCE_SIZE = 16
+
+
+def encode_secret(secret_id: str, key: str, value: str | None) -> bytes:
+    return json.dumps(
+        {"id": secret_id, "key": key, "value": value},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class EncodedSecret(ABC):
+    """A secret held as its encoded JSON response body."""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def json_bytes(self) -> bytes: ...
+
+    def value(self) -> str | None:
+        return json.loads(self.json_bytes())["value"]
+
+
+class InlineSecret(EncodedSecret):
+    """Encoded secret owning its bytes, used for records read from a remote cache."""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def __len__(self):
+        return len(self._data)
+
+    def json_bytes(self) -> bytes:
+        return self._data
+
+
+class StoredSecret(EncodedSecret):
+    """Reference to a secret's pre-encoded JSON response held in a ValueStore."""
+
+    __slots__ = ("_length", "_offset", "_store")
+
+    def __init__(self, store: "ValueStore", offset: int, length: int):
+        self._store = store
+        self._offset = offset
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def encrypted(self) -> bool:
+        return self._store.encrypted
+
+    def json_bytes(self) -> bytes:
+        return self._store.read(self._offset, self._length)
+
+
+class ValueStore:
+    """Append only byte arena holding a client's secrets as encoded JSON responses.
+
+    When encryption is enabled each record is AES-CTR encrypted with a key that
+    only lives in this store, so plaintext values only exist on the heap while a
+    response is being built.
+    """
+
+    def __init__(self, encrypt: bool = False):
+        self._arena = bytearray()
+        self._key = os.urandom(32) if encrypt else None
+
+    def __len__(self):
+        return len(self._arena)
+
+    @property
+    def encrypted(self):
+        return self._key is not None
+
+    def put(self, secret_id: str, key: str, value: str | None) -> StoredSecret:
+        data = encode_secret(secret_id, key, value)
+        if self._key is not None:
+            nonce = os.urandom(NONCE_SIZE)
+            encryptor = Cipher(algorithms.AES(self._key), modes.CTR(nonce)).encryptor()
+            data = nonce + encryptor.update(data) + encryptor.finalize()
+        offset = len(self._arena)
+        self._arena += data
+        return StoredSecret(self, offset, len(data))
+
+    def read(self, offset: int, length: int) -> bytes:
+        # sliced through a view so the record is only copied once
+        with memoryview(self._arena) as arena:
+            if self._key is None:
+                return bytes(arena[offset : offset + length])
+            nonce = bytes(arena[offset : offset + NONCE_SIZE])
+            decryptor = Cipher(algorithms.AES(self._key), modes.CTR(nonce)).decryptor()
+            return (
+                decryptor.update(arena[offset + NONCE_SIZE : offset + length])
+                + decryptor.finalize()
+            )
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the server runs from its own directory, so its modules import each other flat
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "server"))
@@ -0,0 +1,112 @@
+import pytest
+from cache_backend import MemoryCacheBackend, RedisCacheBackend
+from secret import SecretMetaData, SecretResponse
+
+
+def make_secret(secret_id: str, key: str, value: str = "value") -> SecretResponse:
+    return SecretResponse(SecretMetaData(key, secret_id), value)
+
+
+@pytest.fixture(params=["memory", "memory-encrypted", "redis"])
+def backend(request):
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        return RedisCacheBackend(fakeredis.FakeRedis(), "client", "token")
+    return MemoryCacheBackend(encrypt=request.param == "memory-encrypted")
+
+
+@pytest.fixture
+def secrets():
+    secrets = [
+        make_secret(f"id-{i:02d}", f"prod/db/k{i:02d}", f"v{i}") for i in range(25)
+    ]
+    secrets.append(make_secret("id-api", "prod/api/token", '{"a": 1}'))
+    secrets.append(make_secret("id-dev", "dev/db/password"))
+    return secrets
+
+
+def page_through(backend, prefix=None, glob=None, limit=10):
+    keys, cursor = [], None
+    while True:
+        page, cursor = backend.query(prefix, glob, limit, cursor)
+        keys.extend(secret.key for secret in page)
+        if cursor is None:
+            return keys
+
+
+def test_lookups(backend, secrets):
+    assert backend.is_empty()
+    backend.upsert(secrets)
+    assert not backend.is_empty()
+    secret = backend.get_by_key("prod/api/token")
+    assert (secret.id, secret.raw_value) == ("id-api", '{"a": 1}')
+    assert backend.get_by_id("id-03").to_json() == {
+        "key": "prod/db/k03",
+        "id": "id-03",
+        "value": "v3",
+    }
+    assert backend.get_by_id("missing") is None
+    assert backend.get_by_key("missing") is None
+    assert backend.stats().secret_cache_size == len(secrets)
+
+
+def test_prefix_paging(backend, secrets):
+    backend.upsert(secrets)
+    assert page_through(backend, prefix="prod/db/") == [
+        f"prod/db/k{i:02d}" for i in range(25)
+    ]
+    page, cursor = backend.query("prod/db/", None, 10, None)
+    assert len(page) == 10 and cursor is not None
+    assert page_through(backend, prefix="nothing/") == []
+
+
+def test_glob_paging(backend, secrets):
+    backend.upsert(secrets)
+    assert page_through(backend, glob="*/k0?", limit=3) == [
+        f"prod/db/k{i:02d}" for i in range(10)
+    ]
+    assert page_through(backend, glob="*/db/*") == sorted(
+        ["dev/db/password"] + [f"prod/db/k{i:02d}" for i in range(25)]
+    )
+
+
+def test_upsert_renames_key(backend, secrets):
+    backend.upsert(secrets)
+    backend.upsert([make_secret("id-api", "prod/api/renamed", "new")])
+    assert backend.get_by_key("prod/api/token") is None
+    assert backend.get_by_key("prod/api/renamed").raw_value == "new"
+    assert page_through(backend, prefix="prod/api/") == ["prod/api/renamed"]
+    assert backend.stats().keymap_cache_size == len(secrets)
+
+
+def test_delete(backend, secrets):
+    backend.upsert(secrets)
+    backend.delete(["id-api", "missing"])
+    assert backend.get_by_id("id-api") is None
+    assert backend.get_by_key("prod/api/token") is None
+    assert page_through(backend, prefix="prod/api/") == []
+    assert backend.stats().secret_cache_size == len(secrets) - 1
+
+
+def test_replace(backend, secrets):
+    backend.upsert(secrets)
+    backend.replace(
+        [
+            make_secret("id-new", "new/key"),
+            make_secret("id-01", "prod/db/k01", "changed"),
+        ]
+    )
+    assert sorted(secret.key for secret in backend.snapshot()) == [
+        "new/key",
+        "prod/db/k01",
+    ]
+    assert backend.get_by_key("prod/db/k00") is None
+    assert backend.get_by_id("id-01").raw_value == "changed"
+    assert page_through(backend, glob="*") == ["new/key", "prod/db/k01"]
+
+
+def test_clear(backend, secrets):
+    backend.upsert(secrets)
+    backend.clear()
+    assert backend.is_empty()
+    assert page_through(backend, glob="*") == []
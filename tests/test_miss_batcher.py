@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+from miss_batcher import MissBatcher
+
+WINDOW = 0.2
+
+
+class Resolver:
+    def __init__(self, error: Exception | None = None):
+        self.batches: list[list[str]] = []
+        self.error = error
+
+    def __call__(self, items: list[str]) -> dict[str, str]:
+        self.batches.append(sorted(items))
+        if self.error is not None:
+            raise self.error
+        return {item: item.upper() for item in items if item != "missing"}
+
+
+def get_concurrently(batcher: MissBatcher, items: list[str]) -> list:
+    results: list = [None] * len(items)
+
+    def get(i: int):
+        try:
+            results[i] = batcher.get(items[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_coalesces_misses_in_window():
+    resolver = Resolver()
+    batcher = MissBatcher(resolver, WINDOW)
+    items = ["a", "b", "a", "missing", "c", "b"]
+    assert get_concurrently(batcher, items) == ["A", "B", "A", None, "C", "B"]
+    assert resolver.batches == [["a", "b", "c", "missing"]]
+
+
+def test_exception_reaches_every_waiter():
+    error = RuntimeError("upstream down")
+    resolver = Resolver(error)
+    batcher = MissBatcher(resolver, WINDOW)
+    assert get_concurrently(batcher, ["a", "b", "a"]) == [error, error, error]
+    assert len(resolver.batches) == 1
+    # the failed batch is not kept around for later misses
+    resolver.error = None
+    assert batcher.get("a") == "A"
+    assert resolver.batches[-1] == ["a"]
+
+
+def test_interval_spaces_batches():
+    resolver = Resolver()
+    batcher = MissBatcher(resolver, 0.01, interval=WINDOW)
+    assert batcher.get("a") == "A"
+    start = time.monotonic()
+    assert batcher.get("b") == "B"
+    assert time.monotonic() - start == pytest.approx(WINDOW, abs=0.1)
+    assert resolver.batches == [["a"], ["b"]]